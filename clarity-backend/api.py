@@ -1,29 +1,153 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-import base64
-import os
-from video import generate_manim_visualization
-
-app = FastAPI()
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000"],  # React app origin
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-@app.post("/video")
-async def create_video(question: str = Form(...)):
-    video_path = generate_manim_visualization(question)
-    if video_path:
-        return FileResponse(video_path, media_type="video/mp4", filename="visualization.mp4")
-    else:
-        raise HTTPException(status_code=500, detail="Video generation failed")
-
-# You can keep these functions if you need them for other purposes
-def encode_image(image_path):
-    with open(image_path, 'rb') as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from typing import Optional
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+import asyncio
+import base64
+import os
+import re
+from video import generate_manim_visualization, result_cache_key, WORKSPACE_TTL
+from result_cache import result_cache
+from tts_cache import tts_cache
+from progressive import PLAYLIST_FILE
+from jobs import JobManager, SUCCEEDED, INTERACTIVE, PRIORITIES
+from render_executor import render_executor, QueueFullError
+from metrics import track_render_executor
+
+app = FastAPI()
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["http://localhost:3000"],  # React app origin
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# Video generation runs on worker threads so renders never block the event loop.
+# Every admitted job gets a thread; the render executor bounds the manim processes.
+job_manager = JobManager(
+    run_job=lambda job: generate_manim_visualization(job.question, job=job),
+    max_workers=render_executor.workers + render_executor.max_queue,
+    render_executor=render_executor,
+    # Identical questions asked while one is being generated share that job
+    coalesce_key=result_cache_key,
+    # Jobs live as long as the workspaces holding their videos
+    job_ttl=WORKSPACE_TTL,
+)
+
+track_render_executor(render_executor)
+
+def submit_job(question, priority=INTERACTIVE):
+    """(job, coalesced) for the question; 503 when a new job would not fit in the queue"""
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of {', '.join(PRIORITIES)}")
+    try:
+        return job_manager.submit(question, priority)
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Render queue is full, please retry later",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+STREAM_MEDIA_TYPES = {".m3u8": "application/vnd.apple.mpegurl", ".ts": "video/mp2t"}
+
+def job_status(job):
+    status = job.to_dict()
+    status["result_url"] = f"/jobs/{job.id}/video" if job.state == SUCCEEDED else None
+    status["renditions"] = {name: f"/jobs/{job.id}/video?rendition={name}" for name in status["renditions"]}
+    stream_dir, attempt = job.stream_dir, job.stream_attempt
+    streaming = stream_dir is not None and os.path.exists(os.path.join(stream_dir, PLAYLIST_FILE))
+    # Each attempt streams under its own URL, so players notice when a retry starts over
+    status["stream_url"] = f"/jobs/{job.id}/stream/{attempt}/{PLAYLIST_FILE}" if streaming else None
+    return status
+
+@app.post("/video")
+async def create_video(question: str = Form(...)):
+    job, _ = submit_job(question)
+    video_path = await asyncio.wrap_future(job.future)
+    if video_path:
+        return FileResponse(video_path, media_type="video/mp4", filename="visualization.mp4")
+    else:
+        raise HTTPException(status_code=500, detail="Video generation failed")
+
+@app.post("/jobs", status_code=202)
+async def create_job(question: str = Form(...), priority: str = Form(INTERACTIVE)):
+    job, coalesced = submit_job(question, priority)
+    status = job_status(job)
+    status["coalesced"] = coalesced
+    return status
+
+@app.get("/jobs/stats")
+async def get_job_stats():
+    return render_executor.stats()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_status(job)
+
+@app.get("/jobs/{job_id}/video")
+async def get_job_video(job_id: str, rendition: Optional[str] = None):
+    """The best rendition available so far, or a specific one"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.state != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {job.state}")
+    video_path = job.result_path
+    if rendition is not None:
+        video_path = job.renditions.get(rendition)
+        if video_path is None:
+            raise HTTPException(status_code=404, detail=f"Rendition {rendition} is not available")
+    if not os.path.exists(video_path):
+        # The workspace was pruned while the job was still remembered
+        raise HTTPException(status_code=410, detail="The video has expired")
+    return FileResponse(video_path, media_type="video/mp4", filename="visualization.mp4")
+
+@app.delete("/cache")
+async def clear_cache(question: Optional[str] = None):
+    """Invalidate the cached video for one question, or everything if none is given"""
+    if question is not None:
+        return {"invalidated": int(result_cache.invalidate(result_cache_key(question)))}
+    return {"invalidated": result_cache.clear()}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/cache/tts/stats")
+async def get_tts_cache_stats():
+    return tts_cache.stats()
+
+@app.delete("/cache/{key}")
+async def invalidate_cache_entry(key: str):
+    if not result_cache.invalidate(key):
+        raise HTTPException(status_code=404, detail="Cache entry not found")
+    return {"invalidated": 1}
+
+@app.get("/jobs/{job_id}/stream/{attempt}/{filename}")
+async def get_job_stream(job_id: str, attempt: int, filename: str):
+    """HLS playlist and segments of a job whose sections are still being rendered"""
+    job = job_manager.get(job_id)
+    stream_dir = job.stream_dir if job is not None else None
+    if stream_dir is None or job.stream_attempt != attempt:
+        raise HTTPException(status_code=404, detail="No stream for this job")
+    extension = os.path.splitext(filename)[1]
+    if not re.fullmatch(r'[\w.-]+', filename) or extension not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=404, detail="Not found")
+    path = os.path.join(stream_dir, filename)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Not found")
+    headers = {"Cache-Control": "no-cache"} if extension == ".m3u8" else None
+    return FileResponse(path, media_type=STREAM_MEDIA_TYPES[extension], headers=headers)
+
+# You can keep these functions if you need them for other purposes
+def encode_image(image_path):
+    with open(image_path, 'rb') as image_file:
+        return base64.b64encode(image_file.read()).decode('utf-8')
@@ -0,0 +1,189 @@
+"""Run a fixed corpus through the whole pipeline and report per-stage timings.
+
+Code generation is replayed from recorded fixtures and narration comes from
+the offline speech service, so the numbers measure our own stages (and manim)
+rather than the network. Results are written as JSON and can be compared with
+a stored baseline; a stage whose p50 or p95 grew by more than the threshold
+counts as a regression and makes the run exit non-zero.
+
+Usage: python bench.py [--iterations N] [--output results.json]
+                       [--baseline baseline.json] [--save-baseline]
+"""
+import os
+import sys
+import json
+import time
+import math
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CORPUS = os.path.join(BACKEND_DIR, 'fixtures', 'bench_corpus.json')
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, 'fixtures', 'bench_baseline.json')
+
+# Reported in pipeline order; anything else recorded is appended after these
+STAGES = ["generation", "post_processing", "validation", "dry_run", "tts", "render", "mux", "delivery"]
+
+
+def configure(work_dir: str):
+    """Point every cache at a scratch directory and stub out the network.
+
+    Must run before video is imported, since its modules read their settings
+    at import time.
+    """
+    defaults = {
+        "CLARITY_CODEGEN_BACKEND": "replay",
+        "CLARITY_SPEECH_SERVICE": "offline",
+        "CLARITY_CACHE_DIR": os.path.join(work_dir, 'results'),
+        "CLARITY_SIMILARITY_DIR": os.path.join(work_dir, 'similarity'),
+        "CLARITY_TTS_CACHE_DIR": os.path.join(work_dir, 'tts'),
+        "CLARITY_VOICE_CATALOG": os.path.join(work_dir, 'voices.json'),
+        # Every iteration should render from scratch
+        "CLARITY_PARTIAL_CACHE": "0",
+        "CLARITY_SIMILAR_CODE_THRESHOLD": "2",
+        "CLARITY_SIMILAR_VIDEO_THRESHOLD": "2",
+        "CLARITY_UPGRADE_RENDITIONS": "",
+        "ANTHROPIC_API_KEY": "unused",
+        "ELEVEN_API_KEY": "unused",
+    }
+    for name, value in defaults.items():
+        os.environ.setdefault(name, value)
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(values: list) -> dict:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 0.5),
+        "p95": percentile(values, 0.95),
+        "max": max(values),
+    }
+
+
+def peak_rss_mb() -> dict:
+    # ru_maxrss is in kilobytes on Linux; for children it is the largest single child
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def run(corpus: list, iterations: int, work_dir: str) -> dict:
+    from jobs import Job
+    from video import generate_manim_visualization
+    from result_cache import result_cache
+    from tts_cache import tts_cache
+
+    durations = {}
+    totals = []
+    failures = []
+    for iteration in range(iterations):
+        for query in corpus:
+            # Start every run cold so iterations are comparable
+            result_cache.clear()
+            shutil.rmtree(tts_cache.cache_dir, ignore_errors=True)
+            os.makedirs(tts_cache.cache_dir, exist_ok=True)
+
+            job = Job(query)
+            start_time = time.time()
+            path = generate_manim_visualization(query, output_folder=os.path.join(work_dir, 'videos'), job=job)
+            elapsed = time.time() - start_time
+            if path is None:
+                failures.append(query)
+                print(f"[{iteration + 1}/{iterations}] FAILED {query}", file=sys.stderr)
+                continue
+            totals.append(elapsed)
+            for stage in job.stages:
+                durations.setdefault(stage["name"], []).append(stage["duration"])
+            print(f"[{iteration + 1}/{iterations}] {elapsed:7.2f}s {query}", file=sys.stderr)
+
+    ordered = [s for s in STAGES if s in durations] + sorted(s for s in durations if s not in STAGES)
+    return {
+        "created_at": time.time(),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "corpus_size": len(corpus),
+        "iterations": iterations,
+        "failures": failures,
+        "stages": {name: summarize(durations[name]) for name in ordered},
+        "total": summarize(totals) if totals else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Human-readable regressions of results against the baseline"""
+    regressions = []
+    pairs = list(results["stages"].items())
+    if results.get("total") and baseline.get("total"):
+        pairs.append(("total", results["total"]))
+    for name, current in pairs:
+        previous = baseline["total"] if name == "total" else baseline.get("stages", {}).get(name)
+        if previous is None:
+            continue
+        for statistic in ("p50", "p95"):
+            # Ignore noise in stages too short to matter
+            if previous[statistic] < 0.05:
+                continue
+            change = current[statistic] / previous[statistic] - 1
+            if change > threshold:
+                regressions.append(
+                    f"{name} {statistic}: {previous[statistic]:.2f}s -> {current[statistic]:.2f}s (+{change:.0%})"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the video pipeline stage by stage")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.3, help="allowed slowdown before failing (0.3 = 30%%)")
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        corpus = json.load(f)
+
+    work_dir = tempfile.mkdtemp(prefix='clarity-bench-')
+    try:
+        configure(work_dir)
+        results = run(corpus, args.iterations, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps({"stages": results["stages"], "total": results["total"], "peak_rss_mb": results["peak_rss_mb"]}, indent=2))
+
+    if args.save_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    status = 1 if results["failures"] else 0
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            status = 1
+        else:
+            print(f"No stage slowed down by more than {args.threshold:.0%}")
+    else:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+import os
+import time
+import threading
+
+# Defaults for a whole job, across every nested retry loop
+JOB_DEADLINE = float(os.getenv("CLARITY_JOB_DEADLINE", str(15 * 60)))
+JOB_MAX_LLM_CALLS = int(os.getenv("CLARITY_JOB_MAX_LLM_CALLS", "6"))
+
+# No single manim process may run longer than this, even with time left on the job
+RENDER_TIMEOUT = float(os.getenv("CLARITY_RENDER_TIMEOUT", str(10 * 60)))
+
+
+class BudgetExceeded(Exception):
+    """Raised when a job has run out of time or LLM calls."""
+
+
+class JobBudget:
+    """A deadline and an LLM call allowance shared by every stage of one job.
+
+    Stages ask it for a timeout before blocking on anything slow, and spend a
+    call before every generation or repair, so the worst-case cost of a job is
+    bounded no matter how the retry loops nest.
+    """
+
+    def __init__(self, deadline: float = JOB_DEADLINE, max_llm_calls: int = JOB_MAX_LLM_CALLS):
+        self.seconds = deadline
+        self.deadline = time.monotonic() + deadline
+        self.max_llm_calls = max_llm_calls
+        self.llm_calls = 0
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self):
+        if self.expired():
+            raise BudgetExceeded(f"Job exceeded its deadline of {self.seconds:.0f} seconds")
+
+    def timeout(self, cap: float = None) -> float:
+        """Seconds the next blocking step may take, capped; raises if none are left"""
+        self.check()
+        remaining = self.remaining()
+        return min(remaining, cap) if cap is not None else remaining
+
+    def spend_llm_call(self):
+        self.spend_llm_calls(1)
+
+    def spend_llm_calls(self, count: int) -> int:
+        """Spend up to count calls at once; returns how many were granted"""
+        self.check()
+        with self._lock:
+            granted = min(count, self.max_llm_calls - self.llm_calls)
+            if granted <= 0:
+                raise BudgetExceeded(f"Job used all {self.max_llm_calls} of its LLM calls")
+            self.llm_calls += granted
+            return granted
@@ -0,0 +1,415 @@
+import os
+import json
+import time
+import asyncio
+import uuid
+import hashlib
+import logging
+import threading
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+
+from pydantic import BaseModel
+
+from prompts import system_prompt
+from workspace import BACKEND_DIR
+from metrics import RETRIES, HEDGE_CANDIDATES, record_usage
+from rate_limit import TokenBucket, backoff_delay
+from result_cache import normalize_query
+from streaming import CodeStreamChecker, InvalidCodeStream
+from repair import ManimRepair, RepairError, failing_region, error_tail
+
+logger = logging.getLogger('Codegen')
+
+CLAUDE_MODEL = "claude-3-5-sonnet-20241022"
+GENERATION_MAX_TOKENS = 8000
+REPAIR_MAX_TOKENS = 2000
+
+# Attempts per LLM call on rate limits, overload and connection errors
+API_MAX_RETRIES = int(os.getenv("CLARITY_LLM_MAX_RETRIES", "5"))
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+# Requests per minute across every job in the process, with a small burst
+llm_rate_limiter = TokenBucket(
+    rate=float(os.getenv("CLARITY_LLM_RPM", "50")) / 60,
+    capacity=float(os.getenv("CLARITY_LLM_BURST", "5")),
+)
+
+_llm_loop = None
+_llm_loop_lock = threading.Lock()
+
+
+def run_on_llm_loop(coroutine, timeout: float = None):
+    """Run a coroutine on the shared LLM event loop and wait for its result.
+
+    On timeout the coroutine is cancelled, which closes its HTTP request, and
+    TimeoutError is raised.
+    """
+    global _llm_loop
+    with _llm_loop_lock:
+        if _llm_loop is None:
+            _llm_loop = asyncio.new_event_loop()
+            threading.Thread(target=_llm_loop.run_forever, name="llm-loop", daemon=True).start()
+    future = asyncio.run_coroutine_threadsafe(coroutine, _llm_loop)
+    try:
+        return future.result(timeout)
+    except FuturesTimeoutError:
+        future.cancel()
+        raise TimeoutError(f"LLM call did not finish within {timeout:.0f} seconds")
+
+
+class ManimVisualization(BaseModel):
+    manim_code: str
+    description: str
+
+
+class FixtureNotFound(Exception):
+    """Raised by the replay backend for a query that was never recorded."""
+
+
+def generation_messages(query):
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": system_prompt,
+                    "cache_control": {"type": "ephemeral"}
+                },
+                {
+                    "type": "text",
+                    "text": f"Generate a concise but complete Manim visualization for: {query}. Keep the explanation focused and the code efficient to stay within token limits (4000 tokens)."
+                }
+            ]
+        }
+    ]
+
+
+def repair_messages(manim_code, error_output):
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": system_prompt,
+                    "cache_control": {"type": "ephemeral"}
+                },
+                {
+                    "type": "text",
+                    "text": (
+                        "Manim code written under the rules above failed with this error:\n\n"
+                        f"{error_tail(error_output)}\n\n"
+                        "This is the failing region of the code, with line numbers:\n\n"
+                        f"{failing_region(manim_code, error_output)}\n\n"
+                        "Fix the error with the smallest possible edits. Each edit's `original` must be "
+                        "copied exactly from the region, without the line numbers, and must be long "
+                        "enough to appear only once in the file."
+                    )
+                }
+            ]
+        }
+    ]
+
+
+def _retryable_error(e):
+    """The API error behind e if retrying could help, else None"""
+    import anthropic
+
+    seen = set()
+    while e is not None and id(e) not in seen:
+        seen.add(id(e))
+        if isinstance(e, anthropic.APIConnectionError):
+            return e
+        if isinstance(e, anthropic.APIStatusError):
+            return e if e.status_code in RETRYABLE_STATUS else None
+        # instructor wraps API errors in its own exceptions
+        e = e.__cause__ or e.__context__
+    return None
+
+
+class _StreamUsage:
+    """Usage of one streamed message, assembled from its events"""
+
+    def __init__(self):
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_creation_input_tokens = 0
+        self.cache_read_input_tokens = 0
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({vars(self)})"
+
+
+def _recording_stream_usage(create):
+    """Wrap a messages.create so streamed responses record their token usage.
+
+    instructor's partial streaming keeps only the tool input deltas, so the
+    usage in the message_start and message_delta events would otherwise be lost.
+    """
+    async def recording_create(*args, **kwargs):
+        response = await create(*args, **kwargs)
+        if not kwargs.get("stream"):
+            return response
+
+        async def events():
+            usage = None
+            try:
+                async for event in response:
+                    if event.type == "message_start":
+                        usage = _StreamUsage()
+                        for field in vars(usage):
+                            setattr(usage, field, getattr(event.message.usage, field, None) or 0)
+                    elif event.type == "message_delta" and usage is not None:
+                        # Output tokens in message_delta are cumulative
+                        usage.output_tokens = event.usage.output_tokens
+                    yield event
+            finally:
+                await response.close()
+                if usage is not None:
+                    logger.info(f"Cache metrics: {usage}")
+                    record_usage(usage)
+
+        return events()
+
+    return recording_create
+
+
+class AnthropicBackend:
+    """Generates code with Claude through the async client; built on first use.
+
+    Every call runs on one event loop in a background thread, so any number of
+    jobs can have generations in flight while their worker threads just wait
+    for the result. Calls share a token bucket and back off on rate limits and
+    overload as the response headers say, instead of the SDK's own retries.
+    """
+
+    name = "anthropic"
+
+    def __init__(self, model: str = CLAUDE_MODEL):
+        self.model = model
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                import anthropic
+                import instructor
+
+                # Set up Anthropic client with proper patching for prompt caching
+                anthropic_client = anthropic.AsyncAnthropic(api_key=os.environ['ANTHROPIC_API_KEY'], max_retries=0)
+                self._client = instructor.AsyncInstructor(
+                    client=anthropic_client,
+                    create=instructor.patch(
+                        create=_recording_stream_usage(anthropic_client.beta.prompt_caching.messages.create),
+                        mode=instructor.Mode.ANTHROPIC_TOOLS,
+                    ),
+                    mode=instructor.Mode.ANTHROPIC_TOOLS,
+                )
+            return self._client
+
+    def generate(self, query: str, stream: bool = False, timeout: float = None) -> ManimVisualization:
+        return run_on_llm_loop(self.agenerate(query, stream), timeout)
+
+    def repair(self, manim_code: str, error_output: str, timeout: float = None) -> ManimRepair:
+        return run_on_llm_loop(self.arepair(manim_code, error_output), timeout)
+
+    async def _with_backoff(self, call):
+        for attempt in range(API_MAX_RETRIES + 1):
+            await llm_rate_limiter.acquire_async()
+            try:
+                return await call()
+            except Exception as e:
+                error = _retryable_error(e)
+                if error is None or attempt == API_MAX_RETRIES:
+                    raise
+                response = getattr(error, 'response', None)
+                delay = backoff_delay(attempt, response.headers if response is not None else None)
+                if getattr(error, 'status_code', None) == 429:
+                    # Hold back every other caller until the limit resets as well
+                    llm_rate_limiter.pause(delay)
+                RETRIES.labels("llm_api").inc()
+                logger.warning(f"LLM call failed ({error.__class__.__name__}), retrying in {delay:.1f} seconds")
+                await asyncio.sleep(delay)
+
+    async def agenerate(self, query: str, stream: bool = False) -> ManimVisualization:
+        if stream:
+            return await self._with_backoff(lambda: self._astream(query))
+
+        async def call():
+            # Use create_with_completion to get both response and completion info
+            return await self.client.chat.completions.create_with_completion(
+                model=self.model,
+                messages=generation_messages(query),
+                response_model=ManimVisualization,
+                max_tokens=GENERATION_MAX_TOKENS,
+            )
+
+        response, completion = await self._with_backoff(call)
+        # Log cache performance metrics
+        logger.info(f"Cache metrics: {completion.usage}")
+        record_usage(completion.usage)
+        return response
+
+    async def _astream(self, query: str) -> ManimVisualization:
+        """Stream the generation and cancel it as soon as the code is clearly invalid"""
+        checker = CodeStreamChecker()
+        stream = self.client.chat.completions.create_partial(
+            model=self.model,
+            messages=generation_messages(query),
+            response_model=ManimVisualization,
+            max_tokens=GENERATION_MAX_TOKENS,
+        )
+        partial = None
+        try:
+            async for partial in stream:
+                if partial.manim_code:
+                    checker.feed(partial.manim_code)
+        except InvalidCodeStream as e:
+            logger.error(f"Aborting code generation stream early: {e}")
+            raise
+        finally:
+            # Closing the generator closes the HTTP stream, which cancels the request
+            await stream.aclose()
+
+        if partial is None or not partial.manim_code:
+            raise Exception("Generation stream ended without any code")
+        checker.finish(partial.manim_code)
+        return ManimVisualization(manim_code=partial.manim_code, description=partial.description or "")
+
+    async def arepair(self, manim_code: str, error_output: str) -> ManimRepair:
+        async def call():
+            return await self.client.chat.completions.create_with_completion(
+                model=self.model,
+                messages=repair_messages(manim_code, error_output),
+                response_model=ManimRepair,
+                max_tokens=REPAIR_MAX_TOKENS,
+            )
+
+        repair, completion = await self._with_backoff(call)
+        logger.info(f"Cache metrics: {completion.usage}")
+        record_usage(completion.usage)
+        return repair
+
+
+def fixture_name(query: str) -> str:
+    return hashlib.sha256(normalize_query(query).encode('utf-8')).hexdigest()[:16] + '.json'
+
+
+class ReplayBackend:
+    """Serves recorded generations so runs are reproducible and need no network.
+
+    Fixtures are JSON files named after the normalized query. A fixed latency
+    can be added to stand in for the real generation time.
+    """
+
+    name = "replay"
+
+    def __init__(self, fixture_dir: str, latency: float = 0.0):
+        self.fixture_dir = fixture_dir
+        self.latency = latency
+
+    def generate(self, query: str, stream: bool = False, timeout: float = None) -> ManimVisualization:
+        return run_on_llm_loop(self.agenerate(query, stream), timeout)
+
+    async def agenerate(self, query: str, stream: bool = False) -> ManimVisualization:
+        path = os.path.join(self.fixture_dir, fixture_name(query))
+        try:
+            with open(path) as f:
+                fixture = json.load(f)
+        except FileNotFoundError:
+            raise FixtureNotFound(f"No recorded generation for query: {query}")
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return ManimVisualization(manim_code=fixture["manim_code"], description=fixture["description"])
+
+    def repair(self, manim_code: str, error_output: str, timeout: float = None) -> ManimRepair:
+        raise RepairError("Repairs are not recorded; replay fixtures must render as they are")
+
+
+class RecordingBackend:
+    """Passes calls through to another backend and saves each generation as a fixture."""
+
+    name = "record"
+
+    def __init__(self, backend, fixture_dir: str):
+        self.backend = backend
+        self.fixture_dir = fixture_dir
+
+    def generate(self, query: str, stream: bool = False, timeout: float = None) -> ManimVisualization:
+        return run_on_llm_loop(self.agenerate(query, stream), timeout)
+
+    async def agenerate(self, query: str, stream: bool = False) -> ManimVisualization:
+        response = await self.backend.agenerate(query, stream)
+        os.makedirs(self.fixture_dir, exist_ok=True)
+        path = os.path.join(self.fixture_dir, fixture_name(query))
+        tmp_path = f"{path}.tmp-{uuid.uuid4().hex[:8]}"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                "query": query,
+                "model": getattr(self.backend, 'model', None),
+                "recorded_at": time.time(),
+                "manim_code": response.manim_code,
+                "description": response.description,
+            }, f, indent=2)
+        os.replace(tmp_path, path)
+        logger.info(f"Recorded generation fixture {path}")
+        return response
+
+    def repair(self, manim_code: str, error_output: str, timeout: float = None) -> ManimRepair:
+        return self.backend.repair(manim_code, error_output, timeout)
+
+
+async def _first_valid(backend, query: str, count: int, accept, stream: bool):
+    loop = asyncio.get_running_loop()
+    tasks = [asyncio.ensure_future(backend.agenerate(query, stream)) for _ in range(count)]
+    last_error = None
+    try:
+        for finished in asyncio.as_completed(tasks):
+            try:
+                candidate = await finished
+            except Exception as e:
+                logger.warning(f"Candidate generation failed: {e}")
+                HEDGE_CANDIDATES.labels("failed").inc()
+                last_error = e
+                continue
+            # Validation imports manim the first time; keep it off the event loop
+            accepted = await loop.run_in_executor(None, accept, candidate)
+            if accepted is not None:
+                HEDGE_CANDIDATES.labels("used").inc()
+                return accepted
+            HEDGE_CANDIDATES.labels("invalid").inc()
+        raise Exception(f"None of {count} candidates was valid" + (f", last error: {last_error}" if last_error else ""))
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+                HEDGE_CANDIDATES.labels("cancelled").inc()
+
+
+def generate_first_valid(backend, query: str, count: int, accept, stream: bool = False, timeout: float = None):
+    """Request count candidates at once and return accept()'s result for the first good one.
+
+    accept gets each ManimVisualization as it arrives and returns None to
+    reject it. The remaining requests are cancelled as soon as one is accepted.
+    """
+    return run_on_llm_loop(_first_valid(backend, query, count, accept, stream), timeout)
+
+
+def create_backend(name: str, fixture_dir: str, replay_latency: float = 0.0):
+    if name == "anthropic":
+        return AnthropicBackend()
+    if name == "replay":
+        return ReplayBackend(fixture_dir, replay_latency)
+    if name == "record":
+        return RecordingBackend(AnthropicBackend(), fixture_dir)
+    raise ValueError(f"Unknown code generation backend: {name}")
+
+
+codegen_backend = create_backend(
+    os.getenv("CLARITY_CODEGEN_BACKEND", "anthropic"),
+    fixture_dir=os.getenv("CLARITY_CODEGEN_FIXTURES", os.path.join(BACKEND_DIR, 'fixtures', 'codegen')),
+    replay_latency=float(os.getenv("CLARITY_REPLAY_LATENCY", "0")),
+)
@@ -9,6 +9,8 @@ from manim import logger
 from manim_voiceover.helper import create_dotenv_file, remove_bookmarks
 from manim_voiceover.services.base import SpeechService
 
+from voice_catalog import voice_catalog
+
 try:
     from elevenlabs import Voice, VoiceSettings, play
     from elevenlabs import ElevenLabs
@@ -55,9 +57,11 @@ class ElevenLabsService(SpeechService):
         # Initialize ElevenLabs client
         self.client = ElevenLabs()
         
-        # Get available voices
-        response = self.client.voices.get_all()
-        available_voices: List[Voice] = response.voices
+        # Get available voices from the shared catalog
+        available_voices: List[Voice] = [
+            Voice(voice_id=v["voice_id"], name=v["name"])
+            for v in voice_catalog.voices(self._fetch_voices)
+        ]
 
         # Select voice based on name or ID
         if voice_name:
@@ -114,6 +118,9 @@ class ElevenLabsService(SpeechService):
         self.output_format = output_format
         SpeechService.__init__(self, transcription_model=transcription_model, **kwargs)
 
+    def _fetch_voices(self) -> List[dict]:
+        return [{"voice_id": v.voice_id, "name": v.name} for v in self.client.voices.get_all().voices]
+
     def generate_from_text(
         self,
         text: str,
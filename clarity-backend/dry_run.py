@@ -0,0 +1,56 @@
+"""Execute a generated scene's construct() without rendering it.
+
+Animations are skipped, no movie is written and narration goes to a stub
+speech service, so runtime errors anywhere in a long scene surface in seconds
+and without any paid TTS calls.
+
+Usage: python dry_run.py <scene_file> <media_dir>
+"""
+import os
+import sys
+import importlib.util
+from pathlib import Path
+
+from manim import config
+from offline_speech import OfflineSpeechService
+
+
+class StubSpeechService(OfflineSpeechService):
+    """Stands in for ElevenLabsService with instant silent audio of a plausible length."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(
+            latency=0, error_rate=0, audio="silent", shared_cache=False, cache_dir=kwargs.get("cache_dir"),
+        )
+
+
+def main(scene_file, media_dir):
+    config.media_dir = media_dir
+    config.dry_run = True
+    config.disable_caching = True
+
+    # The generated code imports ElevenLabsService from elepatch; swap it out first
+    import elepatch
+    elepatch.ElevenLabsService = StubSpeechService
+
+    module_name = Path(scene_file).stem
+    spec = importlib.util.spec_from_file_location(module_name, scene_file)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+
+    from custom_voiceover_scene import CustomVoiceoverScene
+    scenes = [
+        value for value in vars(module).values()
+        if isinstance(value, type) and issubclass(value, CustomVoiceoverScene)
+        and value.__module__ == module_name
+    ]
+    for scene_class in scenes:
+        scene_class(skip_animations=True).render()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit(__doc__)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(sys.argv[1])))
+    main(sys.argv[1], sys.argv[2])
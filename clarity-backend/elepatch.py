@@ -2,6 +2,8 @@ import os
 import sys
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from mutagen.mp3 import MP3
 from pathlib import Path
 from typing import List, Optional, Union, Dict, Any
 import base64
@@ -12,12 +14,64 @@ from manim import logger
 
 from manim_voiceover.helper import create_dotenv_file, remove_bookmarks
 from manim_voiceover.services.base import SpeechService
+from manim_voiceover.tracker import AUDIO_OFFSET_RESOLUTION
+
+from tts_cache import tts_cache
+from voice_catalog import voice_catalog, VOICE_IDS
+
+BASE_URL = os.getenv("ELEVEN_API_BASE_URL", "https://api.elevenlabs.io/v1")
+
+# (connect, read) seconds; synthesis of a long line can take a while
+REQUEST_TIMEOUT = (5, float(os.getenv("ELEVEN_API_TIMEOUT", "60")))
+
+# Keep-alive connections shared by every service instance in the process
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+
+def word_boundaries_from_alignment(text: str, alignment: Optional[dict]) -> List[dict]:
+    """Word timings from the per-character times returned with the audio"""
+    if not alignment:
+        return []
+    characters = alignment["characters"]
+    starts = alignment["character_start_times_seconds"]
+    ends = alignment["character_end_times_seconds"]
+
+    # The alignment spells out the text character by character; map it back to
+    # offsets in the original so bookmarks still line up
+    boundaries = []
+    word_start = None
+    search_from = 0
+    for i, char in enumerate(characters + [" "]):
+        if not char.isspace() and word_start is None:
+            word_start = i
+        elif char.isspace() and word_start is not None:
+            word = "".join(characters[word_start:i])
+            text_offset = text.find(word, search_from)
+            if text_offset < 0:
+                text_offset = search_from
+            search_from = text_offset + len(word)
+            boundaries.append({
+                "text_offset": text_offset,
+                "audio_offset": int(starts[word_start] * AUDIO_OFFSET_RESOLUTION),
+                "word": word,
+                "text": word,
+                "word_length": len(word),
+                "start": starts[word_start],
+                "end": ends[i - 1],
+            })
+            word_start = None
+    return boundaries
+
+
+def audio_duration(path: Path, word_boundaries: List[dict]) -> float:
+    """Length of the synthesized file, falling back to the end of the last word"""
+    try:
+        return MP3(str(path)).info.length
+    except Exception:
+        return word_boundaries[-1]["end"] if word_boundaries else 0.0
 
-# List of voice IDs to choose from
-VOICE_IDS = [
-    "repzAAjoKlgcT2oOAIWt",
-    "1BUhH8aaMvGMUdGAmWVM",
-]
 
 class VoiceSettings:
     def __init__(
@@ -49,7 +103,7 @@ class Voice:
 class ElevenLabsService(SpeechService):
     """Speech service for ElevenLabs API."""
     
-    BASE_URL = "https://api.elevenlabs.io/v1"
+    BASE_URL = BASE_URL
 
     def __init__(
         self,
@@ -72,14 +126,10 @@ class ElevenLabsService(SpeechService):
             "Content-Type": "application/json"
         }
 
-        # Get available voices
-        response = requests.get(f"{self.BASE_URL}/voices", headers=self.headers)
-        if response.status_code != 200:
-            raise Exception(f"Failed to fetch voices: {response.text}")
-        
+        # Get available voices from the shared catalog
         available_voices = [
-            Voice(v["voice_id"], v["name"]) 
-            for v in response.json()["voices"]
+            Voice(v["voice_id"], v["name"])
+            for v in voice_catalog.voices(self._fetch_voices)
         ]
 
         # Select voice based on name, ID, or random from list
@@ -87,6 +137,9 @@ class ElevenLabsService(SpeechService):
             selected_voice = [v for v in available_voices if v.name == voice_name]
         elif voice_id:
             selected_voice = [v for v in available_voices if v.voice_id == voice_id]
+        elif os.getenv("CLARITY_VOICE_ID"):
+            # Chosen once per job so every render and the prefetch agree
+            selected_voice = [v for v in available_voices if v.voice_id == os.environ["CLARITY_VOICE_ID"]]
         else:
             # Randomly select a voice ID from our list
             random_voice_id = random.choice(VOICE_IDS)
@@ -131,6 +184,12 @@ class ElevenLabsService(SpeechService):
         self.output_format = output_format
         SpeechService.__init__(self, transcription_model=transcription_model, **kwargs)
 
+    def _fetch_voices(self) -> List[dict]:
+        response = session.get(f"{self.BASE_URL}/voices", headers=self.headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code != 200:
+            raise Exception(f"Failed to fetch voices: {response.text}")
+        return [{"voice_id": v["voice_id"], "name": v["name"]} for v in response.json()["voices"]]
+
     def generate_from_text(
         self,
         text: str,
@@ -165,73 +224,69 @@ class ElevenLabsService(SpeechService):
         else:
             audio_path = path
 
+        # The host-wide store outlives each job's media folder
+        shared_key = tts_cache.key(
+            input_text,
+            self.voice.voice_id,
+            self.model,
+            input_data["config"]["voice"]["settings"],
+            self.output_format,
+        )
+        shared_entry = tts_cache.get(shared_key)
+        if shared_entry is not None:
+            tts_cache.link_audio(shared_entry, str(Path(cache_dir) / audio_path))
+            logger.info(f"Reusing cached narration {shared_key[:12]}")
+            return {
+                "input_text": text,
+                "input_data": input_data,
+                "original_audio": audio_path,
+                "word_boundaries": shared_entry["word_boundaries"],
+                "final_audio": audio_path,
+                "duration": shared_entry["duration"],
+            }
+
         try:
-            # Regular TTS request first to get audio
             request_data = {
                 "text": input_text,
                 "model_id": self.model,
-                "output_format": self.output_format,
             }
-            
             if self.voice.settings:
                 request_data["voice_settings"] = self.voice.settings.to_dict()
 
-            # Get audio first
-            headers = self.headers.copy()
-            headers["Accept"] = "audio/mpeg"
-            response = requests.post(
-                f"{self.BASE_URL}/text-to-speech/{self.voice.voice_id}",
+            # One synthesis call returns both the audio and its character alignment
+            response = session.post(
+                f"{self.BASE_URL}/text-to-speech/{self.voice.voice_id}/with-timestamps",
+                params={"output_format": self.output_format},
                 json=request_data,
-                headers=headers
+                headers=self.headers,
+                timeout=REQUEST_TIMEOUT,
             )
 
             if response.status_code != 200:
                 raise Exception(f"API request failed: {response.text}")
 
-            # Save the audio
+            body = response.json()
             output_path = Path(cache_dir) / audio_path
-            output_path.write_bytes(response.content)
-
-            # Now get word timings
-            headers = self.headers.copy()
-            response = requests.post(
-                f"{self.BASE_URL}/text-to-speech/{self.voice.voice_id}/stream",
-                json=request_data,
-                headers=headers
-            )
+            output_path.write_bytes(base64.b64decode(body["audio_base64"]))
 
-            if response.status_code != 200:
-                raise Exception(f"API request failed: {response.text}")
-
-            # Process response to create word boundaries
-            word_boundaries = []
-            current_offset = 0
-            
-            # Split text into words and create simple timing
-            words = input_text.split()
-            total_duration = len(input_text) * 0.05  # Rough estimate
-            time_per_word = total_duration / len(words)
-            
-            for i, word in enumerate(words):
-                # Find actual offset in text
-                while current_offset < len(input_text):
-                    if input_text[current_offset:].startswith(word):
-                        break
-                    current_offset += 1
-                
-                word_boundaries.append({
-                    "text_offset": current_offset,
-                    "audio_offset": int(i * time_per_word * 1000),  # Convert to milliseconds
-                    "word": word,
-                    "start": i * time_per_word,
-                    "end": (i + 1) * time_per_word
-                })
-                current_offset += len(word)
+            word_boundaries = word_boundaries_from_alignment(input_text, body.get("alignment"))
+            total_duration = audio_duration(output_path, word_boundaries)
 
         except Exception as e:
             logger.error(f"ElevenLabs API Error: {str(e)}")
             raise Exception("Failed to generate audio with ElevenLabs.") from e
 
+        # The narration is already in this render's cache; failing to share it is not fatal
+        try:
+            tts_cache.put(
+                shared_key,
+                output_path.read_bytes(),
+                "mp3",
+                {"word_boundaries": word_boundaries, "duration": total_duration},
+            )
+        except OSError as e:
+            logger.warning(f"Could not store narration in the shared TTS cache: {e}")
+
         json_dict = {
             "input_text": text,
             "input_data": input_data,
@@ -246,3 +301,8 @@ class ElevenLabsService(SpeechService):
     def _wrap_generate_from_text(self, text: str, **kwargs) -> dict:
         """Keep the original audio file as is, since we already have word timings"""
         return self.generate_from_text(text, cache_dir=None, path=None, **kwargs)
+
+
+# Synthetic narration for load tests and air-gapped benchmarks
+if os.getenv("CLARITY_SPEECH_SERVICE") == "offline":
+    from offline_speech import OfflineSpeechService as ElevenLabsService
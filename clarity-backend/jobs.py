@@ -0,0 +1,174 @@
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import STAGE_SECONDS, JOB_SECONDS, JOBS, COALESCED
+
+logger = logging.getLogger('JobManager')
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# Priority tiers a job can be submitted with
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BATCH)
+
+
+class Job:
+    """A single video generation request and its progress."""
+
+    def __init__(self, question: str, priority: str = INTERACTIVE):
+        self.id = uuid.uuid4().hex
+        self.question = question
+        self.priority = priority
+        self.state = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stages = []
+        # Generation attempt the pipeline is on, recorded with each span
+        self.attempt = 0
+        self.result_path = None
+        self.renditions = {}
+        # Progressive stream of the current attempt, if one is being published
+        self.stream_dir = None
+        self.stream_attempt = None
+        self.error = None
+        # Identical requests that attached to this job instead of starting their own
+        self.coalesce_key = None
+        self.coalesced = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Record a span for a pipeline stage and export its duration."""
+        start_time = time.time()
+        span = {"name": name, "started_at": start_time, "attempt": self.attempt, "status": "ok"}
+        try:
+            yield
+        except BaseException as e:
+            span["status"] = "error"
+            span["error"] = str(e)
+            raise
+        finally:
+            span["duration"] = time.time() - start_time
+            with self._lock:
+                self.stages.append(span)
+            STAGE_SECONDS.labels(name, span["status"]).observe(span["duration"])
+
+    def add_rendition(self, name: str, path: str):
+        """Make a newly rendered (higher quality) video the job's result"""
+        with self._lock:
+            self.renditions[name] = path
+            self.result_path = path
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            stages = list(self.stages)
+        return {
+            "job_id": self.id,
+            "question": self.question,
+            "priority": self.priority,
+            "state": self.state,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "stages": stages,
+            "renditions": list(self.renditions),
+            "error": self.error,
+            "coalesced_requests": self.coalesced,
+        }
+
+
+class JobManager:
+    """Runs video generation jobs on worker threads, off the event loop."""
+
+    def __init__(self, run_job, max_workers: int = 4, render_executor=None, coalesce_key=None, job_ttl: float = None):
+        self._run_job = run_job
+        self._render_executor = render_executor
+        self._coalesce_key = coalesce_key
+        # Finished jobs are forgotten after this many seconds, once their files may be gone
+        self._job_ttl = job_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        # Unfinished jobs by coalesce key, so identical requests share one run
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def submit(self, question: str, priority: str = INTERACTIVE):
+        """Queue a job, or attach to an identical one still running; returns (job, coalesced)
+
+        Raises QueueFullError when a new job is needed and the render queue has no room.
+        """
+        key = self._coalesce_key(question) if self._coalesce_key is not None else None
+        with self._lock:
+            self._prune()
+            job = self._in_flight.get(key) if key is not None else None
+            if job is not None:
+                job.coalesced += 1
+                COALESCED.inc()
+                logger.info(f"Attached request to in-flight job {job.id} for question: {question}")
+                return job, True
+
+            if self._render_executor is not None:
+                self._render_executor.admit()
+            job = Job(question, priority)
+            job.coalesce_key = key
+            self._jobs[job.id] = job
+            if key is not None:
+                self._in_flight[key] = job
+            job.future = self._executor.submit(self._execute, job)
+        logger.info(f"Queued job {job.id} for question: {question}")
+        return job, False
+
+    def get(self, job_id: str):
+        with self._lock:
+            self._prune()
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        """Drop finished jobs older than the TTL; called with the lock held"""
+        if self._job_ttl is None:
+            return
+        cutoff = time.time() - self._job_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if expired:
+            logger.info(f"Forgot {len(expired)} jobs finished more than {self._job_ttl:.0f} seconds ago")
+
+    def _execute(self, job: Job):
+        job.state = RUNNING
+        job.started_at = time.time()
+        try:
+            result_path = self._run_job(job)
+            # A background upgrade may already have swapped in a better rendition
+            if job.result_path is None:
+                job.result_path = result_path
+            if result_path:
+                job.state = SUCCEEDED
+            else:
+                job.state = FAILED
+                job.error = "Video generation failed"
+        except Exception as e:
+            logger.exception(f"Job {job.id} crashed")
+            job.state = FAILED
+            job.error = str(e)
+        finally:
+            if self._render_executor is not None:
+                self._render_executor.release()
+            with self._lock:
+                if self._in_flight.get(job.coalesce_key) is job:
+                    del self._in_flight[job.coalesce_key]
+            job.finished_at = time.time()
+            JOBS.labels(job.state).inc()
+            JOB_SECONDS.labels(job.state).observe(job.finished_at - job.started_at)
+            logger.info(f"Job {job.id} finished as {job.state} in {job.finished_at - job.started_at:.2f} seconds")
+        return job.result_path
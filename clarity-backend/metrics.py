@@ -0,0 +1,45 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Stages range from milliseconds (cache lookups) to many minutes (renders)
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200)
+
+STAGE_SECONDS = Histogram(
+    "clarity_stage_seconds", "Time spent in each pipeline stage", ["stage", "status"], buckets=STAGE_BUCKETS,
+)
+JOB_SECONDS = Histogram(
+    "clarity_job_seconds", "Time from a job starting to finishing", ["state"], buckets=STAGE_BUCKETS,
+)
+JOBS = Counter("clarity_jobs_total", "Finished jobs", ["state"])
+COALESCED = Counter("clarity_coalesced_requests_total", "Requests attached to an identical in-flight job")
+HEDGE_CANDIDATES = Counter(
+    "clarity_hedge_candidates_total", "Candidates of hedged generations by outcome", ["outcome"],
+)
+RETRIES = Counter("clarity_retries_total", "Retries by kind", ["kind"])
+LLM_TOKENS = Counter("clarity_llm_tokens_total", "Tokens reported by the LLM API", ["kind"])
+PROMPT_CACHE = Counter("clarity_prompt_cache_total", "LLM calls that read or missed the prompt cache", ["result"])
+QUEUE_DEPTH = Gauge("clarity_render_queue_depth", "Admitted jobs not yet holding a render slot")
+RENDERS_RUNNING = Gauge("clarity_renders_running", "manim processes currently running")
+
+TOKEN_FIELDS = {
+    "input_tokens": "input",
+    "output_tokens": "output",
+    "cache_creation_input_tokens": "cache_creation",
+    "cache_read_input_tokens": "cache_read",
+}
+
+
+def record_usage(usage):
+    """Count tokens and prompt cache use from an Anthropic completion's usage"""
+    if usage is None:
+        return
+    for field, kind in TOKEN_FIELDS.items():
+        count = getattr(usage, field, None)
+        if count:
+            LLM_TOKENS.labels(kind).inc(count)
+    PROMPT_CACHE.labels("hit" if getattr(usage, "cache_read_input_tokens", None) else "miss").inc()
+
+
+def track_render_executor(executor):
+    """Expose the executor's live counters as gauges, read at scrape time"""
+    QUEUE_DEPTH.set_function(lambda: executor.stats()["queued"])
+    RENDERS_RUNNING.set_function(lambda: executor.stats()["running"])
@@ -0,0 +1,98 @@
+import os
+import shutil
+import logging
+import subprocess
+
+logger = logging.getLogger('Mux')
+
+FFMPEG = shutil.which('ffmpeg')
+FFPROBE = shutil.which('ffprobe')
+
+
+def available() -> bool:
+    return FFMPEG is not None and FFPROBE is not None
+
+
+def _run(command):
+    subprocess.run(command, check=True, capture_output=True, text=True)
+
+
+def probe_audio(path: str):
+    """(sample_rate, channel_layout) of the first audio stream, or None if there is none"""
+    result = subprocess.run(
+        [FFPROBE, '-v', 'error', '-select_streams', 'a:0',
+         '-show_entries', 'stream=sample_rate,channels', '-of', 'csv=p=0', path],
+        check=True, capture_output=True, text=True,
+    )
+    line = result.stdout.strip()
+    if not line:
+        return None
+    sample_rate, channels = line.split(',')[:2]
+    return sample_rate, 'mono' if channels == '1' else 'stereo'
+
+
+def add_silent_audio(path: str, output: str, sample_rate: str, channel_layout: str):
+    _run([
+        FFMPEG, '-y', '-v', 'error', '-i', path,
+        '-f', 'lavfi', '-i', f'anullsrc=channel_layout={channel_layout}:sample_rate={sample_rate}',
+        '-shortest', '-c:v', 'copy', '-c:a', 'aac', output,
+    ])
+
+
+def concat_videos(paths: list, output: str):
+    """Join section movies end to end without re-encoding the video.
+
+    The concat demuxer needs every input to have the same streams, so sections
+    without narration get a silent track matching the others.
+    """
+    audio = [probe_audio(path) for path in paths]
+    reference = next((a for a in audio if a is not None), None)
+    inputs = []
+    for path, stream in zip(paths, audio):
+        if reference is not None and stream is None:
+            padded = os.path.splitext(path)[0] + '_with_audio.mp4'
+            add_silent_audio(path, padded, *reference)
+            path = padded
+        inputs.append(path)
+
+    list_path = output + '.txt'
+    with open(list_path, 'w') as f:
+        for path in inputs:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    _run([FFMPEG, '-y', '-v', 'error', '-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy', output])
+    os.remove(list_path)
+    logger.info(f"Joined {len(paths)} sections into {output}")
+
+
+def segment_for_hls(path: str, out_dir: str, prefix: str) -> list:
+    """Cut a section into MPEG-TS segments with uniform AAC audio.
+
+    Returns [(segment_name, duration)] in playback order.
+    """
+    playlist = os.path.join(out_dir, f'{prefix}.m3u8')
+    command = [FFMPEG, '-y', '-v', 'error', '-i', path]
+    audio_map = '0:a:0'
+    if probe_audio(path) is None:
+        command += ['-f', 'lavfi', '-i', 'anullsrc=channel_layout=stereo:sample_rate=44100', '-shortest']
+        audio_map = '1:a:0'
+    command += [
+        '-map', '0:v:0', '-map', audio_map,
+        '-c:v', 'copy', '-c:a', 'aac', '-ar', '44100', '-ac', '2',
+        '-f', 'hls', '-hls_time', '4', '-hls_list_size', '0', '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', os.path.join(out_dir, f'{prefix}_%03d.ts'),
+        playlist,
+    ]
+    _run(command)
+
+    segments = []
+    duration = None
+    with open(playlist) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('#EXTINF:'):
+                duration = float(line[len('#EXTINF:'):].rstrip(',').split(',')[0])
+            elif line and not line.startswith('#'):
+                segments.append((line, duration))
+    os.remove(playlist)
+    return segments
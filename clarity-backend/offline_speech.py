@@ -0,0 +1,148 @@
+"""A speech service that never leaves the machine.
+
+Narration is silent MP3 or a sine tone WAV whose length follows the text at a
+normal speaking pace, so scenes time out realistically. Artificial latency and
+an error rate stand in for the network, which makes it usable for load tests
+and benchmarks on a box without ElevenLabs access.
+
+Select it for renders with CLARITY_SPEECH_SERVICE=offline.
+"""
+import os
+import math
+import time
+import wave
+import random
+import struct
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Optional
+
+from manim import logger
+from manim_voiceover.helper import remove_bookmarks
+from manim_voiceover.services.base import SpeechService
+from manim_voiceover.tracker import AUDIO_OFFSET_RESOLUTION
+
+from tts_cache import tts_cache
+
+# Narration pace used to give offline audio a realistic length
+WORDS_PER_SECOND = 2.5
+
+# One silent MPEG-1 Layer III frame: 128 kbps, 44.1 kHz, mono, all-zero side
+# info. Every frame holds 1152 samples.
+MP3_FRAME = b'\xff\xfb\x90\xc0' + bytes(417 - 4)
+MP3_FRAME_SECONDS = 1152 / 44100
+
+TONE_SAMPLE_RATE = 22050
+TONE_FREQUENCY = 440.0
+
+
+def write_silent_mp3(path, seconds: float):
+    frames = max(1, round(seconds / MP3_FRAME_SECONDS))
+    Path(path).write_bytes(MP3_FRAME * frames)
+    return frames * MP3_FRAME_SECONDS
+
+
+def write_tone_wav(path, seconds: float):
+    samples = max(1, round(seconds * TONE_SAMPLE_RATE))
+    period = [
+        int(8000 * math.sin(2 * math.pi * TONE_FREQUENCY * i / TONE_SAMPLE_RATE))
+        for i in range(TONE_SAMPLE_RATE)
+    ]
+    one_second = struct.pack(f'<{TONE_SAMPLE_RATE}h', *period)
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(TONE_SAMPLE_RATE)
+        data = one_second * (samples // TONE_SAMPLE_RATE + 1)
+        f.writeframes(data[:samples * 2])
+    return samples / TONE_SAMPLE_RATE
+
+
+class OfflineSpeechService(SpeechService):
+    """Drop-in replacement for ElevenLabsService producing synthetic narration."""
+
+    def __init__(
+        self,
+        *args,
+        latency: Optional[float] = None,
+        error_rate: Optional[float] = None,
+        audio: Optional[str] = None,
+        shared_cache: bool = True,
+        cache_dir: Optional[str] = None,
+        **kwargs,
+    ):
+        # ElevenLabs arguments such as voice_id and model are accepted and ignored
+        self.latency = latency if latency is not None else float(os.getenv("CLARITY_OFFLINE_TTS_LATENCY", "0"))
+        self.error_rate = error_rate if error_rate is not None else float(os.getenv("CLARITY_OFFLINE_TTS_ERROR_RATE", "0"))
+        self.audio = audio or os.getenv("CLARITY_OFFLINE_TTS_AUDIO", "silent")
+        if self.audio not in ("silent", "tone"):
+            raise ValueError(f"Unknown offline audio kind: {self.audio}")
+        self.shared_cache = shared_cache
+        self.voice = SimpleNamespace(voice_id="offline", name="offline", settings=None)
+        SpeechService.__init__(self, cache_dir=cache_dir)
+
+    def generate_from_text(self, text, cache_dir=None, path=None, **kwargs) -> dict:
+        if cache_dir is None:
+            cache_dir = self.cache_dir
+
+        input_text = remove_bookmarks(text)
+        input_data = {"input_text": input_text, "service": "offline", "audio": self.audio}
+        extension = "mp3" if self.audio == "silent" else "wav"
+        audio_path = path or self.get_audio_basename(input_data) + "." + extension
+        output_path = Path(cache_dir) / audio_path
+
+        shared_key = tts_cache.key(input_text, "offline", self.audio, None, extension)
+        shared_entry = tts_cache.get(shared_key) if self.shared_cache else None
+        if shared_entry is not None:
+            tts_cache.link_audio(shared_entry, str(output_path))
+            word_boundaries, duration = shared_entry["word_boundaries"], shared_entry["duration"]
+        else:
+            if self.latency:
+                time.sleep(self.latency)
+            if self.error_rate and random.random() < self.error_rate:
+                logger.error("Offline speech service simulated a failure")
+                raise Exception("Failed to generate audio with the offline speech service.")
+
+            words = input_text.split()
+            seconds = len(words) / WORDS_PER_SECOND
+            if self.audio == "silent":
+                duration = write_silent_mp3(output_path, seconds)
+            else:
+                duration = write_tone_wav(output_path, seconds)
+            word_boundaries = self._word_boundaries(input_text, words, duration)
+            if self.shared_cache:
+                try:
+                    tts_cache.put(
+                        shared_key, output_path.read_bytes(), extension,
+                        {"word_boundaries": word_boundaries, "duration": duration},
+                    )
+                except OSError as e:
+                    logger.warning(f"Could not store narration in the shared TTS cache: {e}")
+
+        return {
+            "input_text": text,
+            "input_data": input_data,
+            "original_audio": audio_path,
+            "final_audio": audio_path,
+            "word_boundaries": word_boundaries,
+            "duration": duration,
+        }
+
+    @staticmethod
+    def _word_boundaries(input_text, words, duration):
+        word_boundaries = []
+        text_offset = 0
+        for i, word in enumerate(words):
+            text_offset = input_text.find(word, text_offset)
+            start = i * duration / len(words)
+            word_boundaries.append({
+                "text_offset": text_offset,
+                "audio_offset": int(start * AUDIO_OFFSET_RESOLUTION),
+                "word": word,
+                "text": word,
+                "word_length": len(word),
+                "start": start,
+                "end": (i + 1) * duration / len(words),
+            })
+            text_offset += len(word)
+        return word_boundaries
@@ -0,0 +1,163 @@
+import os
+import re
+import ast
+import time
+import uuid
+import fcntl
+import logging
+
+from workspace import BACKEND_DIR
+from streaming import SCENE_BASE
+
+logger = logging.getLogger('PartialMovieCache')
+
+PARTIAL_LIST_FILE = 'partial_movie_file_list.txt'
+
+# manim config for renders using the store: turns off manim's own partial movie cleanup
+MANIM_CONFIG = os.path.join(BACKEND_DIR, 'partial_cache.cfg')
+
+
+def scene_class_name(manim_code_filename: str):
+    """Name of the CustomVoiceoverScene subclass manim will render from this file"""
+    try:
+        with open(manim_code_filename) as f:
+            tree = ast.parse(f.read())
+    except (OSError, SyntaxError):
+        return None
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and any(
+            isinstance(base, ast.Name) and base.id == SCENE_BASE for base in node.bases
+        ):
+            return node.name
+    return None
+
+
+class PartialMovieCache:
+    """Host-wide store of manim partial movie files, shared by every job and worker.
+
+    Files are named by manim's own animation hash, so linking the store into a
+    render's partial_movie_files directory lets manim skip any animation it has
+    already rendered at that quality. Everything is hard-linked, never copied;
+    new files are published with an atomic rename, and eviction runs under a
+    file lock so several API processes can share one store.
+    """
+
+    def __init__(self, store_dir: str, max_bytes: int):
+        self.store_dir = store_dir
+        self.max_bytes = max_bytes
+        self._lock_path = os.path.join(store_dir, '.lock')
+        os.makedirs(store_dir, exist_ok=True)
+
+    def _rendition_dir(self, rendition: str) -> str:
+        path = os.path.join(self.store_dir, rendition)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def prepare(self, partial_dir: str, rendition: str) -> int:
+        """Link every stored partial movie for the rendition into a render's partial directory"""
+        os.makedirs(partial_dir, exist_ok=True)
+        linked = 0
+        for name in os.listdir(self._rendition_dir(rendition)):
+            if not name.endswith('.mp4'):
+                continue
+            target = os.path.join(partial_dir, name)
+            if os.path.exists(target):
+                continue
+            try:
+                os.link(os.path.join(self.store_dir, rendition, name), target)
+                linked += 1
+            except FileNotFoundError:
+                # Evicted by another process in the meantime
+                continue
+        return linked
+
+    def ingest(self, partial_dir: str, rendition: str, render_output: str = '', completed_only: bool = False):
+        """Publish newly rendered partial movies and mark the reused ones as recently used.
+
+        After a failed render the directory also holds the clip that was being
+        written when manim died, so completed_only limits it to the movies the
+        render output reports as fully written.
+        """
+        if not os.path.isdir(partial_dir):
+            return
+        rendition_dir = self._rendition_dir(rendition)
+        written = self._written_files(render_output) if completed_only else None
+        added = 0
+        for name in os.listdir(partial_dir):
+            if not name.endswith('.mp4') or name.startswith('uncached_'):
+                continue
+            if written is not None and name not in written:
+                continue
+            stored = os.path.join(rendition_dir, name)
+            if os.path.exists(stored):
+                continue
+            tmp_path = f"{stored}.tmp-{uuid.uuid4().hex[:8]}"
+            try:
+                os.link(os.path.join(partial_dir, name), tmp_path)
+                os.replace(tmp_path, stored)
+                added += 1
+            except OSError as e:
+                logger.warning(f"Could not store partial movie {name}: {e}")
+
+        now = time.time()
+        for name in self._used_files(partial_dir, render_output):
+            try:
+                os.utime(os.path.join(rendition_dir, name), (now, now))
+            except OSError:
+                continue
+        if added:
+            logger.info(f"Stored {added} new partial movies for {rendition}")
+            self.evict()
+
+    def _used_files(self, partial_dir: str, render_output: str) -> set:
+        used = set()
+        try:
+            with open(os.path.join(partial_dir, PARTIAL_LIST_FILE)) as f:
+                used.update(os.path.basename(m) for m in re.findall(r"file '(?:file:)?([^']+)'", f.read()))
+        except OSError:
+            pass
+        # Rich may wrap long log lines, so match the hashes with whitespace removed
+        compact = re.sub(r'\s+', '', render_output)
+        used.update(f"{h}.mp4" for h in re.findall(r'Usingcacheddata\(hash:([\w]+)\)', compact))
+        return used
+
+    def _written_files(self, render_output: str) -> set:
+        compact = re.sub(r'\s+', '', render_output)
+        # The quoted path may follow rich's source location column
+        return {f"{h}.mp4" for h in re.findall(r"Partialmoviefilewrittenin[^']*'[^']*?(\w+)\.mp4'", compact)}
+
+    def evict(self):
+        """Delete least recently used partial movies until the store fits its quota"""
+        with open(self._lock_path, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            files = []
+            for rendition in os.listdir(self.store_dir):
+                rendition_dir = os.path.join(self.store_dir, rendition)
+                if not os.path.isdir(rendition_dir):
+                    continue
+                for entry in os.scandir(rendition_dir):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in files)
+            evicted = 0
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                evicted += 1
+            if evicted:
+                logger.info(f"Evicted {evicted} partial movies, store is now {total / (1024 * 1024):.1f} MB")
+
+
+partial_cache = PartialMovieCache(
+    store_dir=os.getenv("CLARITY_PARTIAL_CACHE_DIR", os.path.join(BACKEND_DIR, 'cache', 'partial_movies')),
+    max_bytes=int(os.getenv("CLARITY_PARTIAL_CACHE_MAX_MB", "2000")) * 1024 * 1024,
+)
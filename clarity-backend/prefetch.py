@@ -0,0 +1,81 @@
+import os
+import ast
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+
+logger = logging.getLogger('Prefetch')
+
+SPEECH_SERVICE = 'ElevenLabsService'
+
+# Concurrent synthesis requests per job
+PREFETCH_CONCURRENCY = int(os.getenv("CLARITY_TTS_PREFETCH_CONCURRENCY", "6"))
+
+
+def narration_plan(manim_code: str):
+    """(speech service keyword arguments, narration texts) found in generated code.
+
+    Only literal arguments are collected; a voiceover whose text is computed at
+    render time is simply synthesized by the render as before.
+    """
+    try:
+        tree = ast.parse(manim_code)
+    except SyntaxError:
+        return {}, []
+
+    service_kwargs = {}
+    texts = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call):
+            continue
+        func = node.func
+        if isinstance(func, ast.Name) and func.id == SPEECH_SERVICE:
+            for keyword in node.keywords:
+                try:
+                    service_kwargs[keyword.arg] = ast.literal_eval(keyword.value)
+                except ValueError:
+                    continue
+        elif isinstance(func, ast.Attribute) and func.attr == 'voiceover':
+            text = next((k.value for k in node.keywords if k.arg == 'text'), node.args[0] if node.args else None)
+            if isinstance(text, ast.Constant) and isinstance(text.value, str) and text.value not in texts:
+                texts.append(text.value)
+    return service_kwargs, texts
+
+
+def prefetch_narration(manim_code: str, cache_dir: str, voice_id: str = None, timeout: float = None):
+    """Synthesize every narration line into the shared TTS cache before rendering.
+
+    Returns the voice id used, which the render must use too for its lookups to
+    hit, or None if there was nothing to prefetch. Lines not synthesized within
+    timeout seconds are left to the render.
+    """
+    service_kwargs, texts = narration_plan(manim_code)
+    if not texts:
+        return None
+    if voice_id is not None and 'voice_name' not in service_kwargs:
+        service_kwargs.setdefault('voice_id', voice_id)
+
+    # Imported here so the API process only loads manim when it has narration to fetch
+    from elepatch import ElevenLabsService
+
+    os.makedirs(cache_dir, exist_ok=True)
+    start_time = time.time()
+    service = ElevenLabsService(cache_dir=cache_dir, **service_kwargs)
+
+    def synthesize(text):
+        try:
+            service.generate_from_text(text, cache_dir=cache_dir)
+        except Exception as e:
+            # The render will try again and report the error itself
+            logger.warning(f"Could not prefetch narration: {e}")
+
+    pool = ThreadPoolExecutor(max_workers=min(PREFETCH_CONCURRENCY, len(texts)))
+    futures = [pool.submit(synthesize, text) for text in texts]
+    remaining = timeout - (time.time() - start_time) if timeout is not None else None
+    done, pending = wait(futures, timeout=max(0.0, remaining) if remaining is not None else None)
+    # Don't wait for requests still in flight; queued lines are dropped
+    pool.shutdown(wait=False, cancel_futures=True)
+    if pending:
+        logger.warning(f"Stopped prefetching after {timeout:.0f} seconds with {len(pending)} of {len(texts)} lines left")
+    logger.info(f"Prefetched {len(done)} narration lines in {time.time() - start_time:.2f} seconds")
+    return service.voice.voice_id
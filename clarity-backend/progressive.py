@@ -0,0 +1,83 @@
+import os
+import math
+import logging
+import threading
+import subprocess
+
+import mux
+
+logger = logging.getLogger('Progressive')
+
+PLAYLIST_FILE = 'playlist.m3u8'
+
+
+class ProgressivePlaylist:
+    """An HLS event playlist that grows as scene sections finish rendering.
+
+    Sections can finish in any order; each is segmented and appended only once
+    every section before it has been published, so playback can start after the
+    first section instead of the last.
+    """
+
+    def __init__(self, stream_dir: str):
+        self.stream_dir = stream_dir
+        self.playlist_path = os.path.join(stream_dir, PLAYLIST_FILE)
+        self._pending = {}
+        self._next = 0
+        self._sections = []
+        self._target_duration = 1
+        self._failed = False
+        # Whether the playlist was closed with every section in it
+        self.ended = False
+        self._lock = threading.Lock()
+        os.makedirs(stream_dir, exist_ok=True)
+
+    def section_done(self, index: int, video_path: str):
+        with self._lock:
+            if self._failed:
+                return
+            self._pending[index] = video_path
+            while self._next in self._pending:
+                path = self._pending.pop(self._next)
+                try:
+                    segments = mux.segment_for_hls(path, self.stream_dir, f's{self._next:03d}')
+                except subprocess.CalledProcessError as e:
+                    logger.error(f"Could not segment section {self._next}, stopping progressive delivery: {e.stderr}")
+                    self._failed = True
+                    return
+                self._sections.append(segments)
+                self._next += 1
+                self._write(ended=False)
+                logger.info(f"Published section {self._next - 1} to {self.playlist_path}")
+
+    def finish(self):
+        with self._lock:
+            if self._sections and not self._failed:
+                self._write(ended=True)
+                self.ended = True
+
+    def _write(self, ended: bool):
+        longest = max((duration for segments in self._sections for _, duration in segments), default=1)
+        # The target duration may only grow while clients are polling the playlist
+        self._target_duration = max(self._target_duration, math.ceil(longest))
+        lines = [
+            '#EXTM3U',
+            '#EXT-X-VERSION:3',
+            f'#EXT-X-TARGETDURATION:{self._target_duration}',
+            '#EXT-X-MEDIA-SEQUENCE:0',
+            '#EXT-X-PLAYLIST-TYPE:EVENT',
+        ]
+        for index, segments in enumerate(self._sections):
+            if index > 0:
+                # Each section's timestamps start at zero again
+                lines.append('#EXT-X-DISCONTINUITY')
+            for name, duration in segments:
+                lines.append(f'#EXTINF:{duration:.3f},')
+                lines.append(name)
+        if ended:
+            lines.append('#EXT-X-ENDLIST')
+
+        tmp_path = self.playlist_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.playlist_path)
@@ -1,3 +1,6 @@
+import re
+import sys
+
 system_prompt = '''Generate Manim code (Community Edition latest or v0.17.0+ for fallback) to visualize the user query:
 
                     Requirements:
@@ -288,5 +291,11 @@ system_prompt = '''Generate Manim code (Community Edition latest or v0.17.0+ for
 
                 No additional text or explanations outside the JSON structure.'''
 
+# Modules rule 0 of the system prompt allows. Standard library ("base libraries")
+# imports are allowed too, and so is numpy, which `from manim import *` already
+# exposes as np.
+ALLOWED_IMPORTS = frozenset(re.findall(r'^\s*- from ([\w.]+) import', system_prompt, re.MULTILINE)) | {'numpy'}
 
-
+def is_allowed_import(module):
+    top_level = module.split('.')[0]
+    return top_level in ALLOWED_IMPORTS or top_level in sys.stdlib_module_names
@@ -0,0 +1,100 @@
+import time
+import random
+import asyncio
+import threading
+from datetime import datetime, timezone
+
+# Backoff for retries without any hint from the server (seconds)
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+
+RESET_HEADERS = (
+    "anthropic-ratelimit-requests-reset",
+    "anthropic-ratelimit-tokens-reset",
+    "anthropic-ratelimit-input-tokens-reset",
+    "anthropic-ratelimit-output-tokens-reset",
+)
+
+
+def backoff_delay(attempt: int, headers=None) -> float:
+    """Seconds to wait before retry number attempt (0-based).
+
+    The server's retry-after or rate-limit reset time wins when it sent one;
+    otherwise the delay is exponential with full jitter, so concurrent callers
+    that failed together do not all come back at the same moment.
+    """
+    hinted = _hinted_delay(headers) if headers is not None else None
+    if hinted is not None:
+        # A little jitter on top keeps callers released by the same reset apart
+        return hinted + random.uniform(0, min(1.0, BACKOFF_BASE))
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def _hinted_delay(headers):
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+
+    now = datetime.now(timezone.utc)
+    resets = []
+    for name in RESET_HEADERS:
+        value = headers.get(name)
+        if not value:
+            continue
+        try:
+            resets.append((datetime.fromisoformat(value.replace("Z", "+00:00")) - now).total_seconds())
+        except ValueError:
+            continue
+    if resets:
+        return max(0.0, max(resets))
+    return None
+
+
+class TokenBucket:
+    """Request rate limiter shared by every generation in the process.
+
+    Tokens refill continuously at rate per second up to capacity. A caller that
+    was rate limited pauses the whole bucket until the server's reset time, so
+    the other in-flight jobs wait too instead of piling more 429s onto it.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _take(self) -> float:
+        """Take a token and return 0, or return how long to wait for one"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire_async(self):
+        while True:
+            wait = self._take()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
@@ -0,0 +1,181 @@
+import os
+import math
+import time
+import heapq
+import signal
+import itertools
+import logging
+import threading
+import subprocess
+from collections import deque
+
+logger = logging.getLogger('RenderExecutor')
+
+# Rough resident memory of one `manim -ql` process with voiceover (MB)
+RENDER_MEMORY_MB = int(os.getenv("CLARITY_RENDER_MEMORY_MB", "1500"))
+
+
+# Render priorities; lower values are served first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class QueueFullError(Exception):
+    """Raised when the render queue cannot take another job."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Render queue is full, retry after {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+def default_render_workers() -> int:
+    """One render per core, capped by how many renders fit in physical memory"""
+    cpus = os.cpu_count() or 1
+    try:
+        total_mb = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+        by_memory = max(1, total_mb // RENDER_MEMORY_MB)
+    except (ValueError, OSError, AttributeError):
+        by_memory = cpus
+    return max(1, min(cpus, by_memory))
+
+
+def _kill_group(process: subprocess.Popen):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def run_process_group(command, timeout: float = None, check: bool = False, capture_output: bool = False,
+                      **kwargs) -> subprocess.CompletedProcess:
+    """subprocess.run in a new process group, killing the whole group on timeout
+
+    manim starts ffmpeg and LaTeX children that subprocess.run's timeout
+    would leave running.
+    """
+    if capture_output:
+        kwargs['stdout'] = subprocess.PIPE
+        kwargs['stderr'] = subprocess.PIPE
+    with subprocess.Popen(command, start_new_session=True, **kwargs) as process:
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill_group(process)
+            stdout, stderr = process.communicate()
+            raise subprocess.TimeoutExpired(command, timeout, output=stdout, stderr=stderr)
+        except BaseException:
+            _kill_group(process)
+            raise
+    if check and process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+class RenderExecutor:
+    """Bounds how many manim processes run at once and how many jobs may wait for one."""
+
+    def __init__(self, workers: int = None, max_queue: int = None):
+        self.workers = workers or default_render_workers()
+        self.max_queue = max_queue if max_queue is not None else self.workers * 2
+        # Background renders never take the last slot, so a new interactive job
+        # does not wait behind a long high-quality render; with a single worker
+        # there is no room for them at all
+        self.background_workers = self.workers - 1
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._admitted = 0
+        self._running = 0
+        self._background_running = 0
+        self._render_times = deque(maxlen=20)
+        logger.info(f"Render executor started with {self.workers} workers and a queue of {self.max_queue}")
+
+    def admit(self):
+        """Reserve a place for a job, or raise QueueFullError if there is none"""
+        with self._lock:
+            if self._admitted >= self.workers + self.max_queue:
+                raise QueueFullError(self._retry_after())
+            self._admitted += 1
+
+    def release(self):
+        with self._lock:
+            self._admitted = max(0, self._admitted - 1)
+
+    def _retry_after(self) -> int:
+        average = sum(self._render_times) / len(self._render_times) if self._render_times else 60.0
+        waiting = max(0, self._admitted - self.workers)
+        return max(1, math.ceil(average * (waiting + 1) / self.workers))
+
+    def _can_start(self, ticket) -> bool:
+        if self._waiting[0] != ticket or self._running >= self.workers:
+            return False
+        return ticket[0] != BACKGROUND or self._background_running < self.background_workers
+
+    def _acquire(self, priority: int, timeout: float = None) -> bool:
+        """Wait for a slot; False if the timeout passed first"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._lock:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            while not self._can_start(ticket):
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    self._slot_freed.notify_all()
+                    return False
+                self._slot_freed.wait(remaining)
+            heapq.heappop(self._waiting)
+            self._running += 1
+            if priority == BACKGROUND:
+                self._background_running += 1
+            # The next ticket in line may be able to start as well
+            self._slot_freed.notify_all()
+            return True
+
+    def _release(self, priority: int, duration: float):
+        with self._lock:
+            self._running -= 1
+            if priority == BACKGROUND:
+                self._background_running -= 1
+            else:
+                self._render_times.append(duration)
+            self._slot_freed.notify_all()
+
+    def run(self, command, priority: int = INTERACTIVE, timeout: float = None, **kwargs) -> subprocess.CompletedProcess:
+        """Run a render subprocess once a worker slot is free for its priority.
+
+        The timeout covers both waiting for the slot and running; when it
+        passes, the process and everything it started are killed and
+        subprocess.TimeoutExpired is raised.
+        """
+        wait_start_time = time.time()
+        if not self._acquire(priority, timeout):
+            raise subprocess.TimeoutExpired(command, timeout)
+        waited = time.time() - wait_start_time
+        if waited > 1:
+            logger.info(f"Waited {waited:.2f} seconds for a render slot")
+        start_time = time.time()
+        try:
+            return run_process_group(command, timeout - waited if timeout is not None else None, **kwargs)
+        finally:
+            self._release(priority, time.time() - start_time)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "admitted": self._admitted,
+                "running": self._running,
+                "background_running": self._background_running,
+                "waiting_for_slot": len(self._waiting),
+                "queued": max(0, self._admitted - self._running),
+            }
+
+
+render_executor = RenderExecutor(
+    workers=int(os.getenv("CLARITY_RENDER_WORKERS", "0")) or None,
+    max_queue=int(os.environ["CLARITY_RENDER_QUEUE"]) if "CLARITY_RENDER_QUEUE" in os.environ else None,
+)
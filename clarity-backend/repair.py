@@ -0,0 +1,75 @@
+import re
+from typing import List
+
+from pydantic import BaseModel
+
+# Lines of code sent on each side of a failing line
+CONTEXT_LINES = 15
+
+# Only the end of a traceback carries the useful part
+MAX_ERROR_CHARS = 4000
+
+
+class CodeEdit(BaseModel):
+    original: str
+    replacement: str
+
+
+class ManimRepair(BaseModel):
+    edits: List[CodeEdit]
+    explanation: str
+
+
+class RepairError(Exception):
+    """Raised when a repair cannot be built or applied."""
+
+
+def failing_lines(manim_code: str, error_output: str, module: str = 'generated_manim_code') -> list:
+    """Line numbers of the generated code that the error output points at"""
+    lines = [int(n) for n in re.findall(rf'{module}\.py", line (\d+)', error_output)]
+    lines += [int(n) for n in re.findall(r'^Line (\d+):', error_output, re.MULTILINE)]
+    lines += [int(n) for n in re.findall(r'^Syntax error on line (\d+):', error_output, re.MULTILINE)]
+    total = manim_code.count('\n') + 1
+    return sorted({n for n in lines if 1 <= n <= total})
+
+
+def failing_region(manim_code: str, error_output: str) -> str:
+    """The numbered code around the deepest failing line, plus the import header"""
+    lines = failing_lines(manim_code, error_output)
+    if not lines:
+        raise RepairError("Error output does not point at a line of the generated code")
+
+    code_lines = manim_code.split('\n')
+    # The last frame in a traceback is the one closest to the error
+    line_match = re.findall(r'generated_manim_code\.py", line (\d+)', error_output)
+    center = int(line_match[-1]) if line_match else lines[0]
+    start = max(1, center - CONTEXT_LINES)
+    end = min(len(code_lines), center + CONTEXT_LINES)
+
+    header = [line for line in code_lines[:start - 1] if line.startswith(('import ', 'from '))]
+    region = [f"{n:4d}| {code_lines[n - 1]}" for n in range(start, end + 1)]
+    return '\n'.join(header + ([''] if header else []) + region)
+
+
+def error_tail(error_output: str) -> str:
+    return error_output[-MAX_ERROR_CHARS:]
+
+
+def _strip_line_numbers(text: str) -> str:
+    return re.sub(r'^ *\d+\| ', '', text, flags=re.MULTILINE)
+
+
+def apply_repair(manim_code: str, repair: ManimRepair) -> str:
+    """Apply search/replace edits, each of which must match exactly once"""
+    if not repair.edits:
+        raise RepairError("Repair contains no edits")
+    for edit in repair.edits:
+        original, replacement = edit.original, edit.replacement
+        if manim_code.count(original) != 1:
+            # Models sometimes copy the line numbers of the region along with the code
+            original, replacement = _strip_line_numbers(original), _strip_line_numbers(replacement)
+        occurrences = manim_code.count(original)
+        if occurrences != 1:
+            raise RepairError(f"Edit target found {occurrences} times: {original[:80]!r}")
+        manim_code = manim_code.replace(original, replacement)
+    return manim_code
@@ -0,0 +1,198 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+import unicodedata
+
+from workspace import BACKEND_DIR
+
+logger = logging.getLogger('ResultCache')
+
+VIDEO_FILE = 'video.mp4'
+CODE_FILE = 'generated_manim_code.py'
+DESCRIPTION_FILE = 'visualization_description.txt'
+META_FILE = 'meta.json'
+RENDITION_PREFIX = 'rendition_'
+
+
+def normalize_query(query: str) -> str:
+    """Collapse case, whitespace and surrounding punctuation so trivial variants share a key"""
+    query = unicodedata.normalize('NFKC', query).lower()
+    query = re.sub(r'\s+', ' ', query)
+    return query.strip(' \t\n.?!,;:')
+
+
+def make_key(query: str, model: str, prompt_version: str, render_settings: dict) -> str:
+    payload = json.dumps({
+        "query": normalize_query(query),
+        "model": model,
+        "prompt_version": prompt_version,
+        "render_settings": render_settings,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class CachedResult:
+    def __init__(self, entry_dir: str):
+        self.dir = entry_dir
+        self.video_path = os.path.join(entry_dir, VIDEO_FILE)
+        self.code_path = os.path.join(entry_dir, CODE_FILE)
+        self.description_path = os.path.join(entry_dir, DESCRIPTION_FILE)
+
+    @property
+    def renditions(self) -> dict:
+        """Paths of the stored renditions by name, e.g. {'480p15': ..., '720p30': ...}"""
+        return {
+            name[len(RENDITION_PREFIX):-len('.mp4')]: os.path.join(self.dir, name)
+            for name in os.listdir(self.dir)
+            if name.startswith(RENDITION_PREFIX) and name.endswith('.mp4')
+        }
+
+    def read_code(self) -> str:
+        with open(self.code_path) as f:
+            return f.read()
+
+    def read_description(self) -> str:
+        with open(self.description_path) as f:
+            return f.read()
+
+
+class ResultCache:
+    """Persistent cache of finished videos keyed on query, model, prompt and render settings.
+
+    Each entry is a directory holding the MP4, the generated code, the description
+    and a meta.json whose mtime records the last access for LRU eviction.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, ttl: float):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def _read_meta(self, entry_dir: str):
+        try:
+            with open(os.path.join(entry_dir, META_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get(self, key: str):
+        entry_dir = self._entry_dir(key)
+        meta = self._read_meta(entry_dir)
+        if meta is None or not os.path.exists(os.path.join(entry_dir, VIDEO_FILE)):
+            return None
+        if time.time() - meta["created_at"] > self.ttl:
+            logger.info(f"Cache entry {key} expired")
+            self.invalidate(key)
+            return None
+        try:
+            os.utime(os.path.join(entry_dir, META_FILE))
+        except OSError:
+            return None
+        return CachedResult(entry_dir)
+
+    def put(self, key: str, query: str, video_path: str, manim_code: str, description: str, rendition: str = None):
+        """Store a finished result; concurrent puts of the same key keep the first one"""
+        entry_dir = self._entry_dir(key)
+        tmp_dir = f"{entry_dir}.tmp-{uuid.uuid4().hex[:8]}"
+        os.makedirs(tmp_dir)
+        try:
+            _link_or_copy(video_path, os.path.join(tmp_dir, VIDEO_FILE))
+            if rendition is not None:
+                _link_or_copy(video_path, os.path.join(tmp_dir, f"{RENDITION_PREFIX}{rendition}.mp4"))
+            with open(os.path.join(tmp_dir, CODE_FILE), 'w') as f:
+                f.write(manim_code)
+            with open(os.path.join(tmp_dir, DESCRIPTION_FILE), 'w') as f:
+                f.write(description)
+            with open(os.path.join(tmp_dir, META_FILE), 'w') as f:
+                json.dump({"key": key, "query": query, "created_at": time.time()}, f)
+            os.rename(tmp_dir, entry_dir)
+            logger.info(f"Cached result {key} for query: {query}")
+        except OSError as e:
+            logger.warning(f"Could not cache result {key}: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        self.evict()
+
+    def add_rendition(self, key: str, rendition: str, video_path: str):
+        """Add a higher quality rendition and serve it as the entry's video from now on"""
+        entry_dir = self._entry_dir(key)
+        if not os.path.isdir(entry_dir):
+            return
+        try:
+            for name in (f"{RENDITION_PREFIX}{rendition}.mp4", VIDEO_FILE):
+                tmp_path = os.path.join(entry_dir, f"{name}.tmp-{uuid.uuid4().hex[:8]}")
+                _link_or_copy(video_path, tmp_path)
+                os.replace(tmp_path, os.path.join(entry_dir, name))
+            logger.info(f"Added {rendition} rendition to cache entry {key}")
+        except OSError as e:
+            logger.warning(f"Could not add {rendition} rendition to cache entry {key}: {e}")
+
+    def invalidate(self, key: str) -> bool:
+        if not re.fullmatch(r'[0-9a-f]{64}', key):
+            return False
+        entry_dir = self._entry_dir(key)
+        if not os.path.isdir(entry_dir):
+            return False
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        logger.info(f"Invalidated cache entry {key}")
+        return True
+
+    def clear(self) -> int:
+        keys = [name for name in os.listdir(self.cache_dir) if os.path.isdir(self._entry_dir(name))]
+        for key in keys:
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+        logger.info(f"Cleared {len(keys)} cache entries")
+        return len(keys)
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under the size quota"""
+        with self._lock:
+            entries = []
+            now = time.time()
+            for name in os.listdir(self.cache_dir):
+                entry_dir = self._entry_dir(name)
+                meta = self._read_meta(entry_dir)
+                if meta is None:
+                    continue
+                if now - meta["created_at"] > self.ttl:
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                    continue
+                try:
+                    size = sum(entry.stat().st_size for entry in os.scandir(entry_dir))
+                    last_access = os.path.getmtime(os.path.join(entry_dir, META_FILE))
+                except OSError:
+                    continue
+                entries.append((last_access, size, entry_dir))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry_dir in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                logger.info(f"Evicting cache entry {os.path.basename(entry_dir)}")
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= size
+
+
+result_cache = ResultCache(
+    cache_dir=os.getenv("CLARITY_CACHE_DIR", os.path.join(BACKEND_DIR, 'cache', 'results')),
+    max_bytes=int(os.getenv("CLARITY_CACHE_MAX_MB", "5000")) * 1024 * 1024,
+    ttl=float(os.getenv("CLARITY_CACHE_TTL", str(30 * 24 * 60 * 60))),
+)
@@ -0,0 +1,229 @@
+import ast
+import logging
+
+from streaming import SCENE_BASE
+
+logger = logging.getLogger('Sections')
+
+# Calls on self that put something on screen; statements before the first one
+# are setup (speech service, background) that every section needs
+RENDERING_CALLS = {"play", "wait", "voiceover", "add", "add_sound"}
+
+# Methods of the scene itself a section may call; any other call on something
+# reached through self (self.camera.frame.scale(2), ...) changes scene state
+SECTION_SAFE_CALLS = RENDERING_CALLS | {"clear"}
+
+
+def _is_clear(statement) -> bool:
+    return (
+        isinstance(statement, ast.Expr)
+        and isinstance(statement.value, ast.Call)
+        and isinstance(statement.value.func, ast.Attribute)
+        and statement.value.func.attr == "clear"
+        and isinstance(statement.value.func.value, ast.Name)
+        and statement.value.func.value.id == "self"
+    )
+
+
+def _renders(statement) -> bool:
+    for node in ast.walk(statement):
+        if (
+            isinstance(node, ast.Attribute)
+            and node.attr in RENDERING_CALLS
+            and isinstance(node.value, ast.Name)
+            and node.value.id == "self"
+        ):
+            return True
+    return False
+
+
+def _rooted_at_self(node) -> bool:
+    while isinstance(node, (ast.Attribute, ast.Subscript, ast.Call)):
+        node = node.func if isinstance(node, ast.Call) else node.value
+    return isinstance(node, ast.Name) and node.id in ("self", "config")
+
+
+class _FlowNames(ast.NodeVisitor):
+    """Names a block reads before binding them, visiting roughly in execution order."""
+
+    def __init__(self, bound=()):
+        self.bound = set(bound)
+        self.free = set()
+        # Every name the block mentions, whether read or bound
+        self.names = set()
+        self.mutates_scene = False
+
+    def visit_Name(self, node):
+        self.names.add(node.id)
+        if isinstance(node.ctx, ast.Load):
+            if node.id not in self.bound:
+                self.free.add(node.id)
+        else:
+            self.bound.add(node.id)
+
+    def visit_Call(self, node):
+        func = node.func
+        if isinstance(func, ast.Attribute) and _rooted_at_self(func.value) and not (
+            isinstance(func.value, ast.Name) and func.value.id == "self" and func.attr in SECTION_SAFE_CALLS
+        ):
+            self.mutates_scene = True
+        self.generic_visit(node)
+
+    def _visit_target(self, target):
+        if isinstance(target, (ast.Attribute, ast.Subscript)) and _rooted_at_self(target):
+            self.mutates_scene = True
+        self.visit(target)
+
+    def visit_Assign(self, node):
+        self.visit(node.value)
+        for target in node.targets:
+            self._visit_target(target)
+
+    def visit_AugAssign(self, node):
+        self.visit(node.value)
+        if isinstance(node.target, ast.Name) and node.target.id not in self.bound:
+            self.free.add(node.target.id)
+        self._visit_target(node.target)
+
+    def visit_AnnAssign(self, node):
+        if node.value is not None:
+            self.visit(node.value)
+        self._visit_target(node.target)
+
+    def visit_For(self, node):
+        self.visit(node.iter)
+        self._visit_target(node.target)
+        for statement in node.body + node.orelse:
+            self.visit(statement)
+
+    def visit_With(self, node):
+        for item in node.items:
+            self.visit(item.context_expr)
+            if item.optional_vars is not None:
+                self._visit_target(item.optional_vars)
+        for statement in node.body:
+            self.visit(statement)
+
+    def _visit_scope(self, bound, expressions):
+        inner = _FlowNames(self.bound | set(bound))
+        for expression in expressions:
+            inner.visit(expression)
+        self.free |= inner.free
+        self.names |= inner.names
+        self.mutates_scene |= inner.mutates_scene
+
+    def visit_Lambda(self, node):
+        self._visit_scope([a.arg for a in ast.walk(node.args) if isinstance(a, ast.arg)], [node.body])
+
+    def visit_FunctionDef(self, node):
+        self.bound.add(node.name)
+        self._visit_scope([a.arg for a in ast.walk(node.args) if isinstance(a, ast.arg)], node.body)
+
+    def _visit_comprehension(self, node, elements):
+        bound = [n.id for g in node.generators for n in ast.walk(g.target) if isinstance(n, ast.Name)]
+        for generator in node.generators:
+            self._visit_scope(bound, [generator.iter] + generator.ifs)
+        self._visit_scope(bound, elements)
+
+    def visit_ListComp(self, node):
+        self._visit_comprehension(node, [node.elt])
+
+    visit_SetComp = visit_ListComp
+    visit_GeneratorExp = visit_ListComp
+
+    def visit_DictComp(self, node):
+        self._visit_comprehension(node, [node.key, node.value])
+
+
+def split_scene(manim_code: str, min_sections: int = 2):
+    """Split a scene at its top-level self.clear() calls into independently renderable files.
+
+    Each section keeps the module, the class and the setup statements at the
+    start of construct(); the other sections' statements are blanked out so line
+    numbers in tracebacks still match the original code. Returns None when the
+    scene cannot be split safely, e.g. a section uses a variable created by an
+    earlier one, changes scene state that later sections depend on, or two
+    sections use the same object from the setup (one may have moved it).
+    """
+    try:
+        tree = ast.parse(manim_code)
+    except SyntaxError:
+        return None
+
+    scenes = [
+        node for node in tree.body
+        if isinstance(node, ast.ClassDef)
+        and any(isinstance(base, ast.Name) and base.id == SCENE_BASE for base in node.bases)
+    ]
+    if len(scenes) != 1:
+        return None
+    construct = next(
+        (node for node in scenes[0].body if isinstance(node, ast.FunctionDef) and node.name == "construct"),
+        None,
+    )
+    if construct is None or construct.body[0].lineno == construct.lineno:
+        return None
+    body = construct.body
+    if len({statement.lineno for statement in body}) != len(body):
+        return None
+
+    preamble = []
+    for statement in body:
+        if _renders(statement) or _is_clear(statement):
+            break
+        preamble.append(statement)
+
+    sections = [[]]
+    for statement in body[len(preamble):]:
+        if _is_clear(statement):
+            if sections[-1]:
+                sections.append([])
+        else:
+            sections[-1].append(statement)
+    sections = [section for section in sections if section]
+    if len(sections) < min_sections:
+        return None
+
+    arguments = {arg.arg for arg in construct.args.args}
+    flow = _FlowNames(arguments)
+    for statement in preamble:
+        flow.visit(statement)
+    shared = set(flow.bound)
+
+    earlier = set()
+    setup_users = {}
+    for index, section in enumerate(sections):
+        section_flow = _FlowNames(shared)
+        for statement in section:
+            section_flow.visit(statement)
+        if section_flow.mutates_scene:
+            logger.info(f"Section {index} changes scene state, rendering the scene in one piece")
+            return None
+        dependencies = section_flow.free & earlier
+        if dependencies:
+            logger.info(f"Section {index} uses {', '.join(sorted(dependencies))} from earlier sections, rendering in one piece")
+            return None
+        # Each section starts from the setup's state, so it must own what it touches of it
+        for name in section_flow.names & (shared - arguments):
+            if name in setup_users:
+                logger.info(f"Sections {setup_users[name]} and {index} both use {name} from the setup, rendering in one piece")
+                return None
+            setup_users[name] = index
+        earlier |= section_flow.bound - shared
+
+    lines = manim_code.split('\n')
+    keep_always = set()
+    for statement in preamble:
+        keep_always.update(range(statement.lineno, statement.end_lineno + 1))
+    body_lines = set(range(body[0].lineno, body[-1].end_lineno + 1))
+
+    sources = []
+    for section in sections:
+        keep = set(keep_always)
+        for statement in section:
+            keep.update(range(statement.lineno, statement.end_lineno + 1))
+        sources.append('\n'.join(
+            line if number not in body_lines or number in keep else ''
+            for number, line in enumerate(lines, start=1)
+        ))
+    return sources
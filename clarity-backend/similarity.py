@@ -0,0 +1,217 @@
+import os
+import re
+import json
+import time
+import fcntl
+import hashlib
+import logging
+import threading
+
+import numpy as np
+
+from workspace import BACKEND_DIR
+from result_cache import normalize_query
+
+logger = logging.getLogger('SimilarityIndex')
+
+# Words and their character n-grams are hashed into a fixed number of buckets
+# so vectors can be appended to disk without re-vectorizing older queries.
+DIMENSIONS = 2048
+NGRAM_SIZES = (3, 4, 5)
+# Whole words outweigh their n-grams, so "sine" and "cosine" stay apart while
+# "derivative" and "derivatives" still match
+WORD_WEIGHT = 8.0
+# Bumped whenever vectorize changes; stored vectors are rebuilt on load
+VECTOR_VERSION = 2
+
+# Cosine similarity above which a near-duplicate query reuses a previous video,
+# or failing that its generated code. Calibrated on fixtures/similarity_pairs.json:
+# tests/test_similarity.py checks that no pair of different questions reaches
+# the code threshold.
+SIMILAR_VIDEO_THRESHOLD = float(os.getenv("CLARITY_SIMILAR_VIDEO_THRESHOLD", "0.9"))
+SIMILAR_CODE_THRESHOLD = float(os.getenv("CLARITY_SIMILAR_CODE_THRESHOLD", "0.8"))
+
+ENTRIES_FILE = 'entries.jsonl'
+VECTORS_FILE = 'vectors.f32'
+VERSION_FILE = 'version'
+ARTIFACTS_DIR = 'artifacts'
+
+# Words that say nothing about a question's topic
+STOPWORDS = frozenset("""
+a an the of to in on at for from by with and or but is are was were be been it its this that these those
+how does do did what why when where which who whom can could would should will i me my you your we our
+they them their there explain show tell describe demonstrate visualize illustrate teach work works about between vs versus
+""".split())
+
+
+def content_words(query: str) -> list:
+    """The words of a query that carry its topic, in order, with plural 's' dropped"""
+    words = re.findall(r"[a-z0-9]+", normalize_query(query).replace("'s", ""))
+    return [
+        word[:-1] if len(word) > 3 and word.endswith('s') and not word.endswith('ss') else word
+        for word in words if word not in STOPWORDS
+    ]
+
+
+def _bucket(feature: str) -> int:
+    digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=4).digest()
+    return int.from_bytes(digest, 'little') % DIMENSIONS
+
+
+def vectorize(query: str) -> np.ndarray:
+    """Hashed term frequencies of a query's content words and their character n-grams.
+
+    Phrasing ("how does", "explain") is left out entirely, so rephrasings of a
+    question get the same vector.
+    """
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    for word in content_words(query):
+        vector[_bucket(f"word:{word}")] += WORD_WEIGHT
+        text = f" {word} "
+        for n in NGRAM_SIZES:
+            for i in range(len(text) - n + 1):
+                vector[_bucket(text[i:i + n])] += 1.0
+    return vector
+
+
+class Match:
+    def __init__(self, entry: dict, score: float, artifacts_dir: str):
+        self.query = entry["query"]
+        self.cache_key = entry["cache_key"]
+        self.score = score
+        self._artifact_path = os.path.join(artifacts_dir, f"{self.cache_key}.json")
+
+    def load_code(self):
+        """The (manim_code, description) generated for the matched query, if still stored"""
+        try:
+            with open(self._artifact_path) as f:
+                artifact = json.load(f)
+            return artifact["manim_code"], artifact["description"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+
+class SimilarityIndex:
+    """Offline TF-IDF index over previously answered queries.
+
+    Term frequencies are appended to a flat float32 file, one row per query, so
+    the index updates incrementally and loads with a single np.fromfile. Several
+    API processes share the files; writes happen under a file lock, and a
+    process picks up the others' rows before appending its own.
+    """
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self.artifacts_dir = os.path.join(index_dir, ARTIFACTS_DIR)
+        self._entries_path = os.path.join(index_dir, ENTRIES_FILE)
+        self._vectors_path = os.path.join(index_dir, VECTORS_FILE)
+        self._version_path = os.path.join(index_dir, VERSION_FILE)
+        self._lock_path = os.path.join(index_dir, '.lock')
+        self._lock = threading.Lock()
+        os.makedirs(self.artifacts_dir, exist_ok=True)
+        with self._lock, open(self._lock_path, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._load()
+
+    def _stored_version(self):
+        try:
+            with open(self._version_path) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def _load(self):
+        """Read the index from disk; called with both locks held"""
+        start_time = time.time()
+        self._entries = []
+        if os.path.exists(self._entries_path):
+            with open(self._entries_path) as f:
+                self._entries = [json.loads(line) for line in f if line.strip()]
+        tf = np.zeros(0, dtype=np.float32)
+        if os.path.exists(self._vectors_path):
+            tf = np.fromfile(self._vectors_path, dtype=np.float32)
+        tf = tf[:len(tf) - len(tf) % DIMENSIONS].reshape(-1, DIMENSIONS)
+
+        if self._stored_version() != VECTOR_VERSION:
+            if self._entries:
+                logger.info(f"Rebuilding {len(self._entries)} similarity vectors for version {VECTOR_VERSION}")
+                tf = np.array([vectorize(entry["query"]) for entry in self._entries], dtype=np.float32)
+                tf.tofile(self._vectors_path)
+            with open(self._version_path, 'w') as f:
+                f.write(str(VECTOR_VERSION))
+
+        # A crash between the two appends can leave one side a row longer;
+        # trim it on disk too so later appends stay aligned
+        rows = min(len(self._entries), len(tf))
+        if rows != len(self._entries) or rows != len(tf):
+            logger.warning(f"Similarity index files disagree, truncating to {rows} rows")
+            self._entries = self._entries[:rows]
+            tf = tf[:rows].copy()
+            tf.tofile(self._vectors_path)
+            with open(self._entries_path, 'w') as f:
+                f.writelines(json.dumps(entry) + '\n' for entry in self._entries)
+        self._tf = tf
+        self._df = np.count_nonzero(self._tf, axis=0).astype(np.float32)
+        self._known = {normalize_query(entry["query"]) for entry in self._entries}
+        self._weighted = None
+        logger.info(f"Loaded {rows} queries into the similarity index in {time.time() - start_time:.3f} seconds")
+
+    def _idf(self) -> np.ndarray:
+        return np.log((1.0 + len(self._entries)) / (1.0 + self._df)) + 1.0
+
+    def search(self, query: str, k: int = 5) -> list:
+        """Top-k previously answered queries by cosine similarity"""
+        with self._lock:
+            if not self._entries:
+                return []
+            idf = self._idf()
+            if self._weighted is None:
+                weighted = self._tf * idf
+                norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+                self._weighted = weighted / np.maximum(norms, 1e-12)
+            q = vectorize(query) * idf
+            q /= max(np.linalg.norm(q), 1e-12)
+            scores = self._weighted @ q
+            top = np.argsort(-scores)[:k]
+            return [Match(self._entries[i], float(scores[i]), self.artifacts_dir) for i in top]
+
+    def best_match(self, query: str):
+        matches = self.search(query, k=1)
+        return matches[0] if matches else None
+
+    def add(self, query: str, cache_key: str, manim_code: str, description: str):
+        """Append a newly answered query and keep its generated code for reuse"""
+        normalized = normalize_query(query)
+        with self._lock, open(self._lock_path, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Rows appended by other processes must be in memory before this one lands after them
+            try:
+                stored_rows = os.path.getsize(self._vectors_path) // (DIMENSIONS * 4)
+            except FileNotFoundError:
+                stored_rows = 0
+            if stored_rows != len(self._entries):
+                self._load()
+            if normalized in self._known:
+                return
+            artifact_path = os.path.join(self.artifacts_dir, f"{cache_key}.json")
+            with open(artifact_path + '.tmp', 'w') as f:
+                json.dump({"manim_code": manim_code, "description": description}, f)
+            os.replace(artifact_path + '.tmp', artifact_path)
+
+            vector = vectorize(query)
+            entry = {"query": query, "cache_key": cache_key, "created_at": time.time()}
+            with open(self._vectors_path, 'ab') as f:
+                f.write(vector.tobytes())
+            with open(self._entries_path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+
+            self._entries.append(entry)
+            self._tf = np.vstack([self._tf, vector[np.newaxis, :]])
+            self._df += (vector > 0)
+            self._known.add(normalized)
+            self._weighted = None
+
+
+similarity_index = SimilarityIndex(
+    os.getenv("CLARITY_SIMILARITY_DIR", os.path.join(BACKEND_DIR, 'cache', 'similarity'))
+)
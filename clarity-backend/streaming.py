@@ -0,0 +1,124 @@
+import io
+import ast
+import tokenize
+
+from prompts import is_allowed_import
+
+SCENE_BASE = "CustomVoiceoverScene"
+
+# Scene classes the main visualization must not inherit from directly
+OTHER_SCENE_BASES = {"Scene", "VoiceoverScene", "ThreeDScene", "MovingCameraScene", "ZoomedScene"}
+
+
+class InvalidCodeStream(Exception):
+    """Raised as soon as streamed code is clearly not going to be usable."""
+
+
+def _logical_line_complete(text: str) -> bool:
+    """Whether the statement starting text has reached the end of its first logical line"""
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(text + '\n').readline):
+            if token.type == tokenize.NEWLINE:
+                return True
+    except (tokenize.TokenError, SyntaxError):
+        # Still inside brackets, a string or a backslash continuation
+        return False
+    return False
+
+
+class CodeStreamChecker:
+    """Checks manim code statement by statement while it is still being generated.
+
+    Only complete lines are inspected, so it can be fed the growing code
+    string from every partial response. A top-level statement spread over
+    several lines (a parenthesized import, a wrapped class header) is gathered
+    until its first logical line is complete, and only then checked.
+    """
+
+    def __init__(self):
+        self._checked_lines = 0
+        self._header = []
+        self._in_header = True
+        # Lines of the top-level statement being gathered
+        self._statement = []
+        self.scene_classes = []
+
+    def feed(self, code: str):
+        lines = code.split('\n')[:-1]
+        for line in lines[self._checked_lines:]:
+            self._check_line(line)
+        self._checked_lines = len(lines)
+
+    def finish(self, code: str):
+        self.feed(code + '\n')
+        if not self.scene_classes:
+            raise InvalidCodeStream(f"No class inherits from {SCENE_BASE}")
+
+    def _check_line(self, line: str):
+        if line.strip().startswith('```'):
+            raise InvalidCodeStream("Code is wrapped in a markdown fence")
+        if self._statement:
+            self._statement.append(line)
+        elif line and not line[0].isspace() and not line.startswith('#'):
+            self._statement = [line]
+        else:
+            if self._in_header:
+                self._header.append(line)
+            return
+
+        text = '\n'.join(self._statement)
+        if not _logical_line_complete(text):
+            return
+        self._statement = []
+        self._check_statement(text)
+
+    def _check_statement(self, text: str):
+        if text.startswith(('import ', 'from ')):
+            self._check_import(text)
+
+        if text.startswith('class '):
+            self._check_class(text)
+            if self._in_header:
+                # Everything above the first class is complete by now
+                self._in_header = False
+                try:
+                    ast.parse('\n'.join(self._header))
+                except SyntaxError as e:
+                    raise InvalidCodeStream(f"Syntax error before the scene class: {e}")
+        elif self._in_header:
+            self._header.extend(text.split('\n'))
+
+    def _check_import(self, statement: str):
+        try:
+            tree = ast.parse(statement)
+        except SyntaxError:
+            raise InvalidCodeStream(f"Malformed import: {statement}")
+        for node in tree.body:
+            if isinstance(node, ast.Import):
+                modules = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom):
+                modules = [node.module or '']
+            else:
+                continue
+            for module in modules:
+                if not is_allowed_import(module):
+                    raise InvalidCodeStream(f"Import of {module} is not allowed")
+
+    def _check_class(self, header: str):
+        # The body has not been seen yet; stand in for it if the header has none
+        for source in (header, header + '\n    pass'):
+            try:
+                node = ast.parse(source).body[0]
+                break
+            except SyntaxError:
+                continue
+        else:
+            raise InvalidCodeStream(f"Malformed class header: {header}")
+        name = node.name
+        bases = {ast.unparse(base) for base in node.bases}
+        if bases & OTHER_SCENE_BASES:
+            raise InvalidCodeStream(f"{name} must inherit from {SCENE_BASE}, not {', '.join(sorted(bases))}")
+        if SCENE_BASE in bases:
+            self.scene_classes.append(name)
+            if len(self.scene_classes) > 1:
+                raise InvalidCodeStream(f"More than one {SCENE_BASE} subclass: {', '.join(self.scene_classes)}")
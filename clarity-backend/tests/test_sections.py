@@ -0,0 +1,77 @@
+import textwrap
+
+from sections import split_scene
+
+
+def scene(construct_body: str) -> str:
+    return textwrap.dedent('''\
+        from manim import *
+        from custom_voiceover_scene import CustomVoiceoverScene
+
+
+        class Lesson(CustomVoiceoverScene):
+            def construct(self):
+        {body}
+
+
+        if __name__ == "__main__":
+            Lesson().render()
+        ''').format(body=textwrap.indent(textwrap.dedent(construct_body), ' ' * 8))
+
+
+def test_independent_sections_are_split():
+    sources = split_scene(scene('''\
+        self.set_speech_service(None)
+        self.play(Write(Text("First")))
+        self.clear()
+        circle = Circle()
+        self.play(Create(circle))
+    '''))
+    assert sources is not None and len(sources) == 2
+    assert 'Circle()' not in sources[0] and 'Text("First")' not in sources[1]
+
+
+def test_section_using_an_earlier_sections_variable_is_not_split():
+    assert split_scene(scene('''\
+        title = Text("First")
+        self.play(Write(title))
+        self.clear()
+        self.play(FadeIn(title))
+    ''')) is None
+
+
+def test_setup_object_shifted_in_one_section_and_used_in_another_is_not_split():
+    assert split_scene(scene('''\
+        dot = Dot()
+        self.play(Create(dot))
+        dot.shift(RIGHT * 3)
+        self.clear()
+        self.play(FadeIn(dot))
+    ''')) is None
+
+
+def test_setup_object_animated_in_one_section_and_used_in_another_is_not_split():
+    assert split_scene(scene('''\
+        dot = Dot()
+        self.play(dot.animate.shift(RIGHT * 3))
+        self.clear()
+        self.play(FadeIn(dot))
+    ''')) is None
+
+
+def test_camera_change_is_not_split():
+    assert split_scene(scene('''\
+        self.play(Create(Circle()))
+        self.camera.frame.scale(2)
+        self.clear()
+        self.play(Create(Square()))
+    ''')) is None
+
+
+def test_scene_attribute_assignment_is_not_split():
+    assert split_scene(scene('''\
+        self.play(Create(Circle()))
+        self.camera.background_color = WHITE
+        self.clear()
+        self.play(Create(Square()))
+    ''')) is None
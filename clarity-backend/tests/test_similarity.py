@@ -0,0 +1,46 @@
+import os
+import json
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from result_cache import normalize_query
+from similarity import SimilarityIndex, SIMILAR_CODE_THRESHOLD, SIMILAR_VIDEO_THRESHOLD
+
+PAIRS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures', 'similarity_pairs.json')
+
+
+@pytest.fixture(scope="module")
+def pairs():
+    with open(PAIRS_PATH) as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="module")
+def score(pairs, tmp_path_factory):
+    index = SimilarityIndex(str(tmp_path_factory.mktemp("similarity")))
+    queries = sorted({query for kind in pairs.values() for pair in kind for query in pair})
+    for number, query in enumerate(queries):
+        index.add(query, f"{number:064x}", "", "")
+
+    def score(query, other):
+        # Questions differing only in punctuation share one entry
+        other = normalize_query(other)
+        return next(m.score for m in index.search(query, k=len(queries)) if normalize_query(m.query) == other)
+    return score
+
+
+def test_different_questions_never_reuse_code(pairs, score):
+    reused = [(a, b, round(score(a, b), 3)) for a, b in pairs["different"] if score(a, b) >= SIMILAR_CODE_THRESHOLD]
+    assert reused == []
+
+
+def test_most_rephrasings_reuse_code(pairs, score):
+    matched = [score(a, b) >= SIMILAR_CODE_THRESHOLD for a, b in pairs["paraphrases"]]
+    assert sum(matched) / len(matched) >= 0.9
+
+
+def test_rephrasings_without_extra_words_reuse_the_video(score):
+    assert score("How does quicksort work", "Explain quicksort") >= SIMILAR_VIDEO_THRESHOLD
+    assert score("Explain the Pythagorean theorem", "What is the Pythagorean theorem") >= SIMILAR_VIDEO_THRESHOLD
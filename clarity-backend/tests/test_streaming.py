@@ -0,0 +1,52 @@
+import pytest
+
+from streaming import CodeStreamChecker, InvalidCodeStream
+
+SCENE = '''from manim import *
+from custom_voiceover_scene import (
+    CustomVoiceoverScene,
+)
+
+
+class Lesson(
+    CustomVoiceoverScene,
+):
+    def construct(self):
+        self.play(Create(Circle()))
+
+
+if __name__ == "__main__":
+    Lesson().render()
+'''
+
+
+def stream(code: str, chunk: int = 7) -> CodeStreamChecker:
+    """Feed the code the way partial responses arrive, a few characters at a time"""
+    checker = CodeStreamChecker()
+    for end in range(chunk, len(code), chunk):
+        checker.feed(code[:end])
+    checker.finish(code)
+    return checker
+
+
+def test_statements_split_over_several_lines_are_accepted():
+    assert stream(SCENE).scene_classes == ["Lesson"]
+
+
+def test_single_line_class_header_is_accepted():
+    assert stream(SCENE.replace("class Lesson(\n    CustomVoiceoverScene,\n):", "class Lesson(CustomVoiceoverScene):")).scene_classes == ["Lesson"]
+
+
+def test_disallowed_import_in_parentheses_aborts():
+    with pytest.raises(InvalidCodeStream, match="not allowed"):
+        stream(SCENE.replace("from manim import *", "from requests import (\n    get,\n)"))
+
+
+def test_wrong_scene_base_aborts():
+    with pytest.raises(InvalidCodeStream, match="must inherit"):
+        stream(SCENE.replace("    CustomVoiceoverScene,\n):", "    Scene,\n):"))
+
+
+def test_markdown_fence_aborts():
+    with pytest.raises(InvalidCodeStream, match="markdown"):
+        stream("```python\n" + SCENE)
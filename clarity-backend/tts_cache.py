@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import shutil
+import hashlib
+import logging
+
+from workspace import BACKEND_DIR
+
+logger = logging.getLogger('TTSCache')
+
+STATS_FILE = 'stats.json'
+TMP_MARKER = '.tmp-'
+# Temporary files this old were left behind by a crashed writer
+STALE_TMP_SECONDS = 60 * 60
+
+# Part of every key; bump it when the stored metadata changes meaning so old entries are never served
+ENTRY_VERSION = 2
+
+
+def _atomic_write(path: str, data: bytes):
+    tmp_path = f"{path}{TMP_MARKER}{uuid.uuid4().hex[:8]}"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class AudioCache:
+    """Host-wide, content-addressed store of synthesized narration.
+
+    Every render process shares it, unlike manim_voiceover's cache which lives
+    in each job's media folder. An entry is an audio file plus a JSON sidecar
+    with word boundaries and duration; the sidecar is written last so a
+    half-written entry is never served. Hit and miss counters live in a small
+    stats file updated under a lock, so they cover all processes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock_path = os.path.join(cache_dir, '.lock')
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(text: str, voice_id: str, model: str, settings, output_format: str) -> str:
+        payload = json.dumps({
+            "version": ENTRY_VERSION,
+            "text": text,
+            "voice_id": voice_id,
+            "model": model,
+            "settings": settings,
+            "output_format": output_format,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _paths(self, key: str, extension: str = 'mp3'):
+        return os.path.join(self.cache_dir, f"{key}.{extension}"), os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str):
+        """The cached entry's metadata with its audio path, or None"""
+        meta_path = os.path.join(self.cache_dir, f"{key}.json")
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            audio_path = os.path.join(self.cache_dir, meta["audio_file"])
+            now = time.time()
+            os.utime(audio_path, (now, now))
+        except (OSError, ValueError, KeyError):
+            self._count("misses")
+            return None
+        self._count("hits")
+        meta["audio_path"] = audio_path
+        return meta
+
+    def put(self, key: str, audio: bytes, extension: str, meta: dict) -> dict:
+        audio_path, meta_path = self._paths(key, extension)
+        meta = dict(meta, audio_file=os.path.basename(audio_path), created_at=time.time())
+        _atomic_write(audio_path, audio)
+        _atomic_write(meta_path, json.dumps(meta).encode('utf-8'))
+        self.evict()
+        meta["audio_path"] = audio_path
+        return meta
+
+    def link_audio(self, entry: dict, destination: str):
+        """Put a cached entry's audio where manim_voiceover expects it, without copying if possible"""
+        if os.path.exists(destination):
+            os.remove(destination)
+        try:
+            os.link(entry["audio_path"], destination)
+        except OSError:
+            shutil.copy2(entry["audio_path"], destination)
+
+    def _count(self, counter: str):
+        stats_path = os.path.join(self.cache_dir, STATS_FILE)
+        with open(self._lock_path, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(stats_path) as f:
+                    stats = json.load(f)
+            except (OSError, ValueError):
+                stats = {"hits": 0, "misses": 0}
+            stats[counter] = stats.get(counter, 0) + 1
+            _atomic_write(stats_path, json.dumps(stats).encode('utf-8'))
+
+    def stats(self) -> dict:
+        try:
+            with open(os.path.join(self.cache_dir, STATS_FILE)) as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            stats = {"hits": 0, "misses": 0}
+        lookups = stats.get("hits", 0) + stats.get("misses", 0)
+        entries = [e for e in os.scandir(self.cache_dir) if e.name.endswith('.json') and e.name != STATS_FILE]
+        stats["hit_rate"] = stats.get("hits", 0) / lookups if lookups else 0.0
+        stats["entries"] = len(entries)
+        stats["bytes"] = sum(
+            e.stat().st_size for e in os.scandir(self.cache_dir) if e.is_file() and TMP_MARKER not in e.name
+        )
+        return stats
+
+    def evict(self):
+        """Delete least recently used entries until the store fits its quota"""
+        with open(self._lock_path, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            audio_files = []
+            total = 0
+            now = time.time()
+            for entry in os.scandir(self.cache_dir):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if TMP_MARKER in entry.name:
+                    # Another process is still writing it, unless it crashed long ago
+                    if now - stat.st_mtime > STALE_TMP_SECONDS:
+                        try:
+                            os.remove(entry.path)
+                        except FileNotFoundError:
+                            pass
+                    continue
+                total += stat.st_size
+                if not entry.name.endswith('.json') and not entry.name.startswith('.'):
+                    audio_files.append((stat.st_mtime, stat.st_size, entry.path))
+
+            for _, size, audio_path in sorted(audio_files):
+                if total <= self.max_bytes:
+                    break
+                key = os.path.basename(audio_path).split('.')[0]
+                for path in (os.path.join(self.cache_dir, f"{key}.json"), audio_path):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                total -= size
+                logger.info(f"Evicted cached narration {key}")
+
+
+tts_cache = AudioCache(
+    cache_dir=os.getenv("CLARITY_TTS_CACHE_DIR", os.path.join(BACKEND_DIR, 'cache', 'tts')),
+    max_bytes=int(os.getenv("CLARITY_TTS_CACHE_MAX_MB", "1000")) * 1024 * 1024,
+)
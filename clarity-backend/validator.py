@@ -0,0 +1,96 @@
+import ast
+import logging
+import builtins
+import importlib
+from functools import lru_cache
+
+from prompts import is_allowed_import
+from streaming import SCENE_BASE
+
+logger = logging.getLogger('Validator')
+
+
+@lru_cache(maxsize=None)
+def module_exports(module: str):
+    """Names a `from module import *` brings in, or None if the module cannot be imported here"""
+    try:
+        imported = importlib.import_module(module)
+    except Exception as e:
+        logger.warning(f"Cannot import {module} to resolve names: {e}")
+        return None
+    names = getattr(imported, '__all__', None)
+    if names is None:
+        names = [name for name in dir(imported) if not name.startswith('_')]
+    return frozenset(names)
+
+
+def _bound_names(tree: ast.AST) -> set:
+    """Every name the code binds anywhere, ignoring scope to stay permissive"""
+    bound = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            bound.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(node.name)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            bound.update(node.names)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name != '*':
+                    bound.add((alias.asname or alias.name).split('.')[0])
+    return bound
+
+
+def validate_manim_code(manim_code: str) -> list:
+    """Static checks run before spending a manim process on the code.
+
+    Returns a list of problems; an empty list means the code may be rendered.
+    """
+    try:
+        tree = ast.parse(manim_code)
+    except SyntaxError as e:
+        return [f"Syntax error on line {e.lineno}: {e.msg}"]
+
+    problems = []
+    star_modules = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            modules = [node.module or '']
+            if any(alias.name == '*' for alias in node.names):
+                star_modules.append(node.module)
+        else:
+            continue
+        for module in modules:
+            if not is_allowed_import(module):
+                problems.append(f"Line {node.lineno}: import of {module} is not allowed")
+
+    scenes = [
+        node.name for node in tree.body
+        if isinstance(node, ast.ClassDef)
+        and any(isinstance(base, ast.Name) and base.id == SCENE_BASE for base in node.bases)
+    ]
+    if len(scenes) != 1:
+        problems.append(f"Expected exactly one {SCENE_BASE} subclass, found {len(scenes)}: {', '.join(scenes)}")
+
+    known = _bound_names(tree) | set(dir(builtins))
+    for module in star_modules:
+        exports = module_exports(module)
+        if exports is None:
+            # Without the real exports any unresolved name could be legitimate
+            return problems
+        known |= exports
+
+    unresolved = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id not in known:
+            unresolved.setdefault(node.id, node.lineno)
+    for name, lineno in sorted(unresolved.items(), key=lambda item: item[1]):
+        problems.append(f"Line {lineno}: name {name} is not defined")
+
+    return problems
@@ -1,17 +1,36 @@
 import subprocess
+import sys
 import os
 import re
 from dotenv import load_dotenv
+
+# Load environment variables from .env file before any module reads its settings
+load_dotenv()
+
 import json
 import time
 import logging
-from pydantic import BaseModel
 import uuid
-import shutil
-import anthropic
-import instructor
 from prompts import system_prompt
 from datetime import datetime
+from contextlib import nullcontext
+from workspace import Workspace, prune_workspaces
+from render_executor import render_executor, INTERACTIVE, BACKGROUND
+from result_cache import result_cache, make_key
+from similarity import similarity_index, SIMILAR_VIDEO_THRESHOLD, SIMILAR_CODE_THRESHOLD
+from validator import validate_manim_code
+from repair import RepairError, apply_repair
+from codegen import codegen_backend, generate_first_valid, CLAUDE_MODEL
+from sections import split_scene
+from concurrent.futures import ThreadPoolExecutor
+import mux
+from progressive import ProgressivePlaylist
+from partial_cache import partial_cache, scene_class_name, MANIM_CONFIG as PARTIAL_CACHE_CONFIG
+from prefetch import prefetch_narration
+from metrics import RETRIES
+from rate_limit import backoff_delay
+from budget import JobBudget, BudgetExceeded, RENDER_TIMEOUT
+import hashlib
 
 # Set up logging with timestamps
 logging.basicConfig(
@@ -22,17 +41,53 @@ logging.basicConfig(
 
 logger = logging.getLogger('VideoGenerator')
 
-# Load environment variables from .env file
-load_dotenv()
+# Job workspaces older than this are deleted (seconds)
+WORKSPACE_TTL = float(os.getenv("CLARITY_WORKSPACE_TTL", str(24 * 60 * 60)))
+
+# Changes to the system prompt produce different videos, so they invalidate cached results
+PROMPT_VERSION = hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()[:12]
+
+# manim quality flag for each rendition, from the fast preview upwards
+QUALITY_FLAGS = {"480p15": "-ql", "720p30": "-qm", "1080p60": "-qh"}
+PREVIEW_RENDITION = "480p15"
+
+# Renditions re-rendered in the background after the preview has been delivered
+UPGRADE_RENDITIONS = [r for r in os.getenv("CLARITY_UPGRADE_RENDITIONS", "720p30").split(",") if r in QUALITY_FLAGS]
+
+RENDER_SETTINGS = {"quality": QUALITY_FLAGS[PREVIEW_RENDITION], "resolution": PREVIEW_RENDITION}
+
+# Stream generations so clearly broken code is abandoned before it finishes
+STREAM_GENERATION = os.getenv("CLARITY_STREAM_GENERATION", "1") == "1"
+
+# Execute each scene once without rendering or TTS before the real render
+DRY_RUN = os.getenv("CLARITY_DRY_RUN", "1") == "1"
+DRY_RUN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dry_run.py')
 
-# Set up Anthropic client with proper patching for prompt caching
-client = instructor.Instructor(
-    client=anthropic.Anthropic(api_key=os.environ['ANTHROPIC_API_KEY']),
-    create=instructor.patch(
-        create=anthropic.Anthropic().beta.prompt_caching.messages.create,
-        mode=instructor.Mode.ANTHROPIC_TOOLS,
-    ),
-    mode=instructor.Mode.ANTHROPIC_TOOLS,
+# Failed renders are patched in place this many times before regenerating from scratch
+MAX_REPAIRS = int(os.getenv("CLARITY_MAX_REPAIRS", "2"))
+
+# Render scenes that split cleanly at self.clear() as parallel sections joined by ffmpeg
+SECTION_PARALLEL = os.getenv("CLARITY_SECTION_PARALLEL", "1") == "1"
+
+# Publish sections as an HLS playlist while the rest of the scene is still rendering
+PROGRESSIVE_DELIVERY = os.getenv("CLARITY_PROGRESSIVE_DELIVERY", "1") == "1"
+
+# Share manim's partial movie files between renders instead of passing --disable_caching
+PARTIAL_CACHE = os.getenv("CLARITY_PARTIAL_CACHE", "1") == "1"
+
+# Synthesize all narration concurrently before manim starts
+TTS_PREFETCH = os.getenv("CLARITY_TTS_PREFETCH", "1") == "1"
+
+# Candidate generations requested at once per priority tier; the first valid one is rendered
+HEDGE_K = {
+    tier: int(k) for tier, k in (
+        entry.split(":") for entry in os.getenv("CLARITY_HEDGE_K", "interactive:3,batch:1").split(",") if entry
+    )
+}
+
+# Background re-renders at higher quality once the preview has been delivered
+upgrade_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("CLARITY_UPGRADE_WORKERS", "2")), thread_name_prefix="upgrade"
 )
 
 def post_process_latex(manim_code):
@@ -47,172 +102,456 @@ def post_process_latex(manim_code):
         r'MathTex\((.*?)\)', lambda m: f'MathTex(r"\\text{{{{{m.group(1)}}}}}")', manim_code)
     return manim_code
 
-class ManimVisualization(BaseModel):
-    manim_code: str
-    description: str
-
-def generate_manim_code(query, max_retries=3):
+def generate_manim_code(query, max_retries=3, stream=STREAM_GENERATION, budget=None):
     """Generate manim code with retries using prompt caching"""
     for attempt in range(max_retries):
         try:
             start_time = time.time()
             logger.info(f"Attempt {attempt + 1} of {max_retries} to generate manim code")
             
-            # Use create_with_completion to get both response and completion info
-            response, completion = client.chat.completions.create_with_completion(
-                model="claude-3-5-sonnet-20241022",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": system_prompt,
-                                "cache_control": {"type": "ephemeral"}
-                            },
-                            {
-                                "type": "text",
-                                "text": f"Generate a concise but complete Manim visualization for: {query}. Keep the explanation focused and the code efficient to stay within token limits (4000 tokens)."
-                            }
-                        ]
-                    }
-                ],
-                response_model=ManimVisualization,
-                max_tokens=8000,
-            )
+            timeout = None
+            if budget is not None:
+                budget.spend_llm_call()
+                timeout = budget.timeout()
+            response = codegen_backend.generate(query, stream=stream, timeout=timeout)
             
             end_time = time.time()
             logger.info(f"Code generation took {end_time - start_time:.2f} seconds")
             
-            # Log cache performance metrics
-            logger.info(f"Cache metrics: {completion.usage}")
-            
             # Check response validity
-            if len(response.manim_code) < 100:
-                raise Exception("Generated code is too short to be valid")
-            
-            if "if __name__ == " not in response.manim_code:
-                raise Exception("Generated code appears to be truncated (missing main block)")
+            problem = check_generated_code(response.manim_code)
+            if problem is not None:
+                raise Exception(problem)
             
             return response
             
+        except BudgetExceeded:
+            raise
         except Exception as e:
             logger.error(f"Error generating code on attempt {attempt + 1}: {str(e)}")
+            if budget is not None:
+                # A timed out call means the job's deadline has passed
+                budget.check()
             if attempt == max_retries - 1:
                 raise Exception("Failed to generate valid manim code after all retries")
-            time.sleep(2)
+            RETRIES.labels("generation").inc()
+            delay = backoff_delay(attempt)
+            if budget is not None:
+                # Never sleep past the job's deadline
+                delay = min(delay, max(0.0, budget.remaining()))
+            time.sleep(delay)
+    return None
+
+def check_generated_code(manim_code):
+    """Problems that mean a response was cut off or empty, before any validation"""
+    if len(manim_code) < 100:
+        return "Generated code is too short to be valid"
+    if "if __name__ == " not in manim_code:
+        return "Generated code appears to be truncated (missing main block)"
     return None
 
-def test_manim_code(manim_code_filename, output_file):
-    """Test if the manim code runs without errors"""
+def generate_hedged_code(query, k, budget=None, job=None):
+    """Request k candidates concurrently and keep the first that is valid after post-processing
+
+    Returns (manim_code, description) with the code already post-processed and
+    validated; both steps are recorded as stages for every candidate checked.
+    """
+    timeout = None
+    if budget is not None:
+        k = budget.spend_llm_calls(k)
+        timeout = budget.timeout()
+
+    def accept(candidate):
+        problem = check_generated_code(candidate.manim_code)
+        if problem is not None:
+            logger.info(f"Rejected candidate: {problem}")
+            return None
+        with _stage(job, "post_processing"):
+            manim_code = post_process_latex(candidate.manim_code)
+        with _stage(job, "validation"):
+            problems = validate_manim_code(manim_code)
+        if problems:
+            logger.info(f"Rejected candidate with {len(problems)} validation problems: {problems[0]}")
+            return None
+        return manim_code, candidate.description
+
     start_time = time.time()
     try:
-        result = subprocess.run(
-            ['manim', '-ql', '-o', output_file, manim_code_filename, '--disable_caching', '--write_to_movie'],
+        result = generate_first_valid(codegen_backend, query, k, accept, stream=STREAM_GENERATION, timeout=timeout)
+    except TimeoutError:
+        if budget is not None:
+            budget.check()
+        raise
+    logger.info(f"First valid of {k} candidates arrived in {time.time() - start_time:.2f} seconds")
+    return result
+
+def test_manim_code(manim_code_filename, output_file, media_dir=None, cwd=None, env=None,
+                    rendition=PREVIEW_RENDITION, priority=INTERACTIVE, budget=None):
+    """Test if the manim code runs without errors; returns (passed, error_output)"""
+    start_time = time.time()
+    command = ['manim', QUALITY_FLAGS[rendition], '-o', output_file, manim_code_filename, '--write_to_movie']
+    if media_dir:
+        command += ['--media_dir', media_dir]
+
+    # Reuse animations any job has already rendered at this quality
+    partial_dir = None
+    scene = scene_class_name(manim_code_filename) if PARTIAL_CACHE and media_dir else None
+    if scene is not None:
+        module = os.path.splitext(os.path.basename(manim_code_filename))[0]
+        partial_dir = os.path.join(media_dir, 'videos', module, rendition, 'partial_movie_files', scene)
+        linked = partial_cache.prepare(partial_dir, rendition)
+        logger.info(f"Linked {linked} cached partial movies for {scene}")
+        command += ['--config_file', PARTIAL_CACHE_CONFIG]
+    else:
+        command.append('--disable_caching')
+
+    timeout = budget.timeout(RENDER_TIMEOUT) if budget is not None else RENDER_TIMEOUT
+    try:
+        result = render_executor.run(
+            command,
+            priority=priority,
+            timeout=timeout,
             check=True,
             capture_output=True,
-            text=True
+            text=True,
+            cwd=cwd,
+            env=env,
         )
         end_time = time.time()
         logger.info(f"Manim test took {end_time - start_time:.2f} seconds")
         logger.info("Manim test output:")
         logger.info(result.stdout)
-        return True
+        if partial_dir is not None:
+            partial_cache.ingest(partial_dir, rendition, result.stdout + result.stderr)
+        return True, None
     except subprocess.CalledProcessError as e:
         end_time = time.time()
         logger.error(f"Error testing Manim code (took {end_time - start_time:.2f} seconds): {e}")
         logger.error("Manim error output:")
         logger.error(e.stderr)
-        return False
+        # Animations finished before the failure are still valid for the retry
+        if partial_dir is not None:
+            partial_cache.ingest(partial_dir, rendition, (e.stdout or '') + (e.stderr or ''), completed_only=True)
+        return False, e.stderr
+    except subprocess.TimeoutExpired:
+        logger.error(f"Manim render killed after {time.time() - start_time:.2f} seconds")
+        if budget is not None:
+            budget.check()
+        return False, f"Rendering did not finish within {timeout:.0f} seconds; the scene is too long or stuck in a loop."
 
-def generate_manim_visualization(query, output_folder='./output_videos', max_retries=3):
+def dry_run_manim_code(manim_code_filename, media_dir, cwd=None, env=None, budget=None):
+    """Run construct() with animations skipped and stub narration to catch runtime errors cheaply"""
+    start_time = time.time()
+    timeout = budget.timeout(RENDER_TIMEOUT) if budget is not None else RENDER_TIMEOUT
+    try:
+        render_executor.run(
+            [sys.executable, DRY_RUN_SCRIPT, manim_code_filename, media_dir],
+            timeout=timeout,
+            check=True,
+            capture_output=True,
+            text=True,
+            cwd=cwd,
+            env=env,
+        )
+        logger.info(f"Dry run passed in {time.time() - start_time:.2f} seconds")
+        return True, None
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Dry run failed after {time.time() - start_time:.2f} seconds")
+        logger.error(e.stderr)
+        return False, e.stderr
+    except subprocess.TimeoutExpired:
+        logger.error(f"Dry run killed after {time.time() - start_time:.2f} seconds")
+        if budget is not None:
+            budget.check()
+        return False, f"Running construct() did not finish within {timeout:.0f} seconds; it may be stuck in a loop."
+
+def repair_manim_code(manim_code, error_output, budget=None):
+    """Ask for a targeted patch to the failing region instead of regenerating everything"""
+    start_time = time.time()
+    timeout = None
+    if budget is not None:
+        budget.spend_llm_call()
+        timeout = budget.timeout()
+    repair = codegen_backend.repair(manim_code, error_output, timeout=timeout)
+    logger.info(f"Repair generation took {time.time() - start_time:.2f} seconds: {repair.explanation}")
+    return apply_repair(manim_code, repair)
+
+def find_video(video_dir, output_file):
+    if not os.path.isdir(video_dir):
+        return None
+    for file in os.listdir(video_dir):
+        if file.startswith(output_file) and file.endswith(".mp4"):
+            return os.path.join(video_dir, file)
+    return None
+
+def render_video(workspace, manim_code, output_file, job=None, playlist=None,
+                 rendition=PREVIEW_RENDITION, priority=INTERACTIVE, budget=None):
+    """Render the saved code, in parallel sections when the scene allows it; returns (video_path, error_output)
+
+    Finished sections are appended to the progressive playlist, if one is given.
+    """
+    resolution = rendition
+    sections = split_scene(manim_code) if SECTION_PARALLEL and mux.available() else None
+    if sections is not None:
+        logger.info(f"Rendering {len(sections)} sections in parallel")
+        section_spaces = [workspace.section(i) for i in range(len(sections))]
+        for space, source in zip(section_spaces, sections):
+            with open(space.code_path, 'w') as f:
+                f.write(source)
+
+        def render_section(index):
+            space = section_spaces[index]
+            passed, error_output = test_manim_code(
+                space.code_path, f'section_{rendition}',
+                media_dir=space.media_dir, cwd=space.root, env=space.render_env(),
+                rendition=rendition, priority=priority, budget=budget,
+            )
+            if passed and playlist is not None:
+                video_path = find_video(space.video_dir(resolution), f'section_{rendition}')
+                if video_path is not None:
+                    playlist.section_done(index, video_path)
+            return passed, error_output
+
+        with ThreadPoolExecutor(max_workers=len(sections)) as pool:
+            results = list(pool.map(render_section, range(len(sections))))
+        for passed, error_output in results:
+            if not passed:
+                return None, error_output
+
+        section_paths = [find_video(space.video_dir(resolution), f'section_{rendition}') for space in section_spaces]
+        if None in section_paths:
+            logger.warning("A section rendered without producing a video")
+            return None, None
+
+        os.makedirs(workspace.video_dir(resolution), exist_ok=True)
+        output_video_path = os.path.join(workspace.video_dir(resolution), output_file + '.mp4')
+        try:
+            with _stage(job, "mux"):
+                mux.concat_videos(section_paths, output_video_path)
+            if playlist is not None:
+                playlist.finish()
+            return output_video_path, None
+        except subprocess.CalledProcessError as e:
+            logger.error(f"Joining sections failed, rendering in one piece: {e.stderr}")
+
+    passed, error_output = test_manim_code(
+        workspace.code_path, output_file,
+        media_dir=workspace.media_dir, cwd=workspace.root, env=workspace.render_env(),
+        rendition=rendition, priority=priority, budget=budget,
+    )
+    if not passed:
+        return None, error_output
+    return find_video(workspace.video_dir(resolution), output_file), None
+
+def upgrade_renditions(job, workspace, manim_code, cache_key):
+    """Re-render already validated code at higher qualities and swap each one in when done"""
+    for rendition in UPGRADE_RENDITIONS:
+        try:
+            with _stage(job, f"upgrade_{rendition}"):
+                video_path, error_output = render_video(
+                    workspace, manim_code, f'output_{rendition}', rendition=rendition, priority=BACKGROUND,
+                )
+        except Exception as e:
+            logger.error(f"Upgrade to {rendition} crashed: {e}")
+            return
+        if video_path is None:
+            logger.error(f"Upgrade to {rendition} failed, keeping the previous rendition")
+            return
+        logger.info(f"Upgraded job {job.id} to {rendition}")
+        job.add_rendition(rendition, video_path)
+        result_cache.add_rendition(cache_key, rendition, video_path)
+
+def attach_cached_renditions(job, cached):
+    if job is None:
+        return
+    renditions = cached.renditions
+    for rendition in QUALITY_FLAGS:
+        if rendition in renditions:
+            job.add_rendition(rendition, renditions[rendition])
+
+def _stage(job, name):
+    """Time a pipeline stage on the job, if there is one"""
+    return job.stage(name) if job is not None else nullcontext()
+
+def result_cache_key(query):
+    return make_key(query, CLAUDE_MODEL, PROMPT_VERSION, RENDER_SETTINGS)
+
+def generate_manim_visualization(query, output_folder='./output_videos', max_retries=3, job=None, budget=None):
     total_start_time = time.time()
+    # One deadline and LLM allowance for every retry loop below
+    budget = budget or JobBudget()
+    hedge_k = HEDGE_K.get(job.priority if job is not None else "interactive", 1)
+    if codegen_backend.name == "record":
+        # A query has one fixture, which every candidate would overwrite
+        hedge_k = 1
     logger.info(f"Starting visualization generation at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
-    # Delete the media folder if it exists
-    media_folder = './media'
-    if os.path.exists(media_folder):
-        logger.info(f"Deleting existing media folder: {media_folder}")
-        shutil.rmtree(media_folder)
+    # Serve repeated questions straight from the result cache
+    cache_key = result_cache_key(query)
+    with _stage(job, "cache_lookup"):
+        cached = result_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"Result cache hit for query: {query} in {time.time() - total_start_time:.3f} seconds")
+        attach_cached_renditions(job, cached)
+        return cached.video_path
 
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-    
-    logger.info(f"Starting visualization generation for query: {query}")
-
-    # Copy elepatch.py to output_videos folder
-    copy_start_time = time.time()
-    src_path = 'elepatch.py'
-    dst_path = os.path.join(output_folder, 'elepatch.py')
-    shutil.copy2(src_path, dst_path)
-    logger.info(f"Copied elepatch.py in {time.time() - copy_start_time:.2f} seconds")
-
-    # Create custom_voiceover_scene.py
-    scene_start_time = time.time()
-    custom_scene_path = os.path.join(output_folder, 'custom_voiceover_scene.py')
-    with open(custom_scene_path, 'w') as f:
-        f.write('''
-from manim_voiceover import VoiceoverScene
-from elepatch import ElevenLabsService
-
-class CustomVoiceoverScene(VoiceoverScene):
-    def set_speech_service(self, speech_service, create_subcaption=False):
-        super().set_speech_service(speech_service, create_subcaption=create_subcaption)
-''')
-    logger.info(f"Created custom scene in {time.time() - scene_start_time:.2f} seconds")
+    # Near-duplicate questions reuse an earlier video or at least its code
+    reused = None
+    with _stage(job, "similarity_lookup"):
+        match = similarity_index.best_match(query)
+    if match is not None and match.score >= SIMILAR_CODE_THRESHOLD:
+        logger.info(f"Closest previous query (similarity {match.score:.3f}): {match.query}")
+        similar = result_cache.get(match.cache_key) if match.score >= SIMILAR_VIDEO_THRESHOLD else None
+        if similar is not None:
+            logger.info(f"Reusing video for similar query in {time.time() - total_start_time:.3f} seconds")
+            attach_cached_renditions(job, similar)
+            return similar.video_path
+        reused = match.load_code()
+
+    # Every job renders in its own workspace so concurrent jobs never share files
+    prune_workspaces(output_folder, WORKSPACE_TTL)
+    workspace = Workspace.for_job(output_folder, job.id if job is not None else None)
+    logger.info(f"Starting visualization generation for query: {query} in {workspace.root}")
+
+    # Code and error output of the last failure, for targeted repair
+    failure = None
+    repairs = 0
+    # Whether the current code descends from a similar query's answer rather than this query's
+    from_similar = False
 
     # Generate and test code with retries
     for attempt in range(max_retries):
         try:
             attempt_start_time = time.time()
             logger.info(f"Attempt {attempt + 1} of {max_retries}")
-            
-            # Generate code
-            claude_start_time = time.time()
-            claude_response = generate_manim_code(query)
-            claude_end_time = time.time()
-            logger.info(f"Code generation completed in {claude_end_time - claude_start_time:.2f} seconds")
+            budget.check()
+            if job is not None:
+                job.attempt = attempt
+            if attempt > 0:
+                RETRIES.labels("attempt").inc()
 
-            manim_code = claude_response.manim_code
-            description = claude_response.description
-            manim_code = post_process_latex(manim_code)
+            repaired_code = None
+            # Hedged generations arrive already validated
+            validated = False
+            if failure is not None and repairs < MAX_REPAIRS:
+                repairs += 1
+                RETRIES.labels("repair").inc()
+                try:
+                    with _stage(job, "repair"):
+                        repaired_code = repair_manim_code(*failure, budget=budget)
+                    logger.info(f"Repaired code with a targeted patch ({repairs} of {MAX_REPAIRS})")
+                except RepairError as e:
+                    logger.warning(f"Targeted repair not possible, regenerating: {e}")
+            failure = None
+
+            if repaired_code is not None:
+                manim_code = repaired_code
+            elif attempt == 0 and reused is not None:
+                # Render the similar query's already post-processed code before paying for a new generation
+                logger.info("Reusing generated code from a similar query")
+                manim_code, description = reused
+                from_similar = True
+            elif hedge_k > 1:
+                from_similar = False
+                with _stage(job, "generation"):
+                    manim_code, description = generate_hedged_code(query, hedge_k, budget, job)
+                validated = True
+            else:
+                # Generate code
+                from_similar = False
+                claude_start_time = time.time()
+                with _stage(job, "generation"):
+                    claude_response = generate_manim_code(query, budget=budget)
+                claude_end_time = time.time()
+                logger.info(f"Code generation completed in {claude_end_time - claude_start_time:.2f} seconds")
+
+                manim_code = claude_response.manim_code
+                description = claude_response.description
+                with _stage(job, "post_processing"):
+                    manim_code = post_process_latex(manim_code)
 
             # Save the code
             save_start_time = time.time()
-            manim_code_filename = os.path.join(output_folder, 'generated_manim_code.py')
-            with open(manim_code_filename, 'w') as f:
+            with open(workspace.code_path, 'w') as f:
                 f.write(manim_code)
             logger.info(f"Code saved in {time.time() - save_start_time:.2f} seconds")
 
+            # Reject statically broken code before paying for a manim process
+            if not validated:
+                with _stage(job, "validation"):
+                    problems = validate_manim_code(manim_code)
+                if problems:
+                    logger.error("Generated code failed validation, retrying...")
+                    for problem in problems:
+                        logger.error(f"  {problem}")
+                    failure = (manim_code, '\n'.join(problems))
+                    continue
+
+            if DRY_RUN:
+                with _stage(job, "dry_run"):
+                    passed, error_output = dry_run_manim_code(
+                        workspace.code_path, os.path.join(workspace.root, 'dry_run_media'),
+                        cwd=workspace.root, env=workspace.render_env(), budget=budget,
+                    )
+                if not passed:
+                    logger.error("Dry run failed, retrying...")
+                    failure = (manim_code, error_output)
+                    continue
+
+            if TTS_PREFETCH:
+                prefetch_timeout = budget.timeout()
+                with _stage(job, "tts"):
+                    try:
+                        workspace.voice_id = prefetch_narration(
+                            manim_code, os.path.join(workspace.root, 'prefetch_audio'), workspace.voice_id,
+                            timeout=prefetch_timeout,
+                        ) or workspace.voice_id
+                    except Exception as e:
+                        logger.warning(f"Narration prefetch failed, the render will synthesize it: {e}")
+
             # Test the code
             test_start_time = time.time()
             logger.info("Testing Manim code...")
             random_id = str(uuid.uuid4())[:8]
             output_file = f'output_{random_id}'
             
-            if test_manim_code(manim_code_filename, output_file):
+            playlist = None
+            if job is not None and PROGRESSIVE_DELIVERY and mux.available():
+                playlist = ProgressivePlaylist(os.path.join(workspace.root, 'stream', str(attempt)))
+                job.stream_attempt = attempt
+                job.stream_dir = playlist.stream_dir
+
+            with _stage(job, "render"):
+                output_video_path, error_output = render_video(
+                    workspace, manim_code, output_file, job, playlist, budget=budget,
+                )
+            if playlist is not None and not playlist.ended:
+                # The stream stops short of the final video (a failed attempt, or a one-piece
+                # fallback render), so players must not keep waiting on it
+                job.stream_dir = None
+
+            if output_video_path is not None:
                 logger.info(f"Manim test successful in {time.time() - test_start_time:.2f} seconds")
-                
-                # Find the generated video
-                video_quality = "480p15"
-                video_dir = os.path.join("media", "videos", "generated_manim_code", video_quality)
-                
-                output_video_path = None
-                for file in os.listdir(video_dir):
-                    if file.endswith(".mp4"):
-                        output_video_path = os.path.join(video_dir, file)
-                        logger.info(f"Video file found at {output_video_path}")
-                        break
-                
-                if output_video_path is None:
-                    logger.warning("No video file found in the expected directory.")
-                    continue
+                logger.info(f"Video file found at {output_video_path}")
+
+                with _stage(job, "delivery"):
+                    # Save the description
+                    with open(workspace.description_path, 'w') as f:
+                        f.write(description)
+                    logger.info(f"Description saved to {workspace.description_path}")
 
-                # Save the description
-                description_filename = os.path.join(output_folder, 'visualization_description.txt')
-                with open(description_filename, 'w') as f:
-                    f.write(description)
-                logger.info(f"Description saved to {description_filename}")
+                    # Another query's answer is never cached as this query's answer
+                    if from_similar:
+                        logger.info("Not caching a video rendered from a similar query's code")
+                    else:
+                        result_cache.put(cache_key, query, output_video_path, manim_code, description, PREVIEW_RENDITION)
+                        similarity_index.add(query, cache_key, manim_code, description)
+
+                    # Deliver the preview now; sharper renditions replace it when they finish
+                    if job is not None:
+                        job.add_rendition(PREVIEW_RENDITION, output_video_path)
+                        if UPGRADE_RENDITIONS and render_executor.background_workers > 0:
+                            upgrade_executor.submit(upgrade_renditions, job, workspace, manim_code, cache_key)
 
                 total_end_time = time.time()
                 total_duration = total_end_time - total_start_time
@@ -221,18 +560,29 @@ class CustomVoiceoverScene(VoiceoverScene):
 
                 return output_video_path
 
-            logger.error(f"Manim code test failed after {time.time() - test_start_time:.2f} seconds, retrying...")
+            if error_output is None:
+                logger.warning("No video file found in the expected directory.")
+                continue
+
+            logger.error(f"Manim test failed after {time.time() - test_start_time:.2f} seconds, retrying...")
+            failure = (manim_code, error_output)
             
+        except BudgetExceeded as e:
+            logger.error(f"Giving up after {time.time() - total_start_time:.2f} seconds: {e}")
+            workspace.remove()
+            raise
         except Exception as e:
             attempt_duration = time.time() - attempt_start_time
             logger.error(f"Error on attempt {attempt + 1} (took {attempt_duration:.2f} seconds): {str(e)}")
             if attempt == max_retries - 1:
                 logger.error("All attempts failed")
+                workspace.remove()
                 return None
             logger.info("Retrying...")
 
     total_duration = time.time() - total_start_time
     logger.info(f"Process failed after {total_duration:.2f} seconds")
+    workspace.remove()
     return None
 
 if __name__ == "__main__":
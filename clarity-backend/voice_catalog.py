@@ -0,0 +1,92 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+
+from workspace import BACKEND_DIR
+
+logger = logging.getLogger('VoiceCatalog')
+
+# Voices the scenes are narrated with; also the catalog when ElevenLabs is unreachable
+VOICE_IDS = [
+    "repzAAjoKlgcT2oOAIWt",
+    "1BUhH8aaMvGMUdGAmWVM",
+]
+
+
+class VoiceCatalog:
+    """The account's ElevenLabs voices, fetched at most once per TTL for the whole host.
+
+    Every speech service construction used to list the voices over the network,
+    once per rendered scene. The list is now kept in memory and in a JSON file
+    shared by all render processes; if it is stale and the API cannot be
+    reached, the stale list or else the known VOICE_IDS are used instead, and
+    no process tries again until retry_after seconds have passed.
+    """
+
+    def __init__(self, path: str, ttl: float, retry_after: float):
+        self.path = path
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self._voices = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            return data["fetched_at"], data["voices"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write(self, voices: list):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp-{uuid.uuid4().hex[:8]}"
+        with open(tmp_path, 'w') as f:
+            json.dump({"fetched_at": self._fetched_at, "voices": voices}, f)
+        os.replace(tmp_path, self.path)
+
+    def voices(self, fetch) -> list:
+        """[{"voice_id", "name"}], calling fetch() only when the catalog has expired"""
+        with self._lock:
+            now = time.time()
+            if self._voices is not None and now - self._fetched_at < self.ttl:
+                return self._voices
+
+            stored = self._read()
+            if stored is not None:
+                self._fetched_at, self._voices = stored
+                if now - self._fetched_at < self.ttl:
+                    return self._voices
+
+            try:
+                voices = fetch()
+            except Exception as e:
+                if self._voices:
+                    logger.warning(f"Could not refresh the voice catalog, using the stored one: {e}")
+                else:
+                    logger.warning(f"Could not fetch the voice catalog, falling back to known voices: {e}")
+                    self._voices = [{"voice_id": voice_id, "name": ""} for voice_id in VOICE_IDS]
+                # Date the attempt so the catalog expires again retry_after seconds from now
+                self._fetched_at = now - self.ttl + min(self.ttl, self.retry_after)
+                try:
+                    self._write(self._voices)
+                except OSError as write_error:
+                    logger.warning(f"Could not store the voice catalog: {write_error}")
+                return self._voices
+
+            self._voices = voices
+            self._fetched_at = now
+            self._write(voices)
+            logger.info(f"Fetched {len(voices)} voices into the catalog")
+            return voices
+
+
+voice_catalog = VoiceCatalog(
+    path=os.getenv("CLARITY_VOICE_CATALOG", os.path.join(BACKEND_DIR, 'cache', 'voices.json')),
+    ttl=float(os.getenv("CLARITY_VOICE_CATALOG_TTL", str(24 * 60 * 60))),
+    retry_after=float(os.getenv("CLARITY_VOICE_CATALOG_RETRY", str(5 * 60))),
+)
@@ -0,0 +1,74 @@
+import os
+import time
+import uuid
+import random
+import shutil
+import logging
+
+logger = logging.getLogger('Workspace')
+
+# elepatch.py and custom_voiceover_scene.py live next to this file; renders
+# import them from here through PYTHONPATH instead of copying them per job.
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Workspace:
+    """An isolated directory holding one job's generated code and media."""
+
+    def __init__(self, root: str, job_id: str):
+        self.job_id = job_id
+        self.root = os.path.abspath(root)
+        self.media_dir = os.path.join(self.root, 'media')
+        self.code_path = os.path.join(self.root, 'generated_manim_code.py')
+        self.description_path = os.path.join(self.root, 'visualization_description.txt')
+        # Narration voice fixed for every render of this job, so they share cached audio
+        self.voice_id = None
+        os.makedirs(self.media_dir, exist_ok=True)
+
+    @classmethod
+    def for_job(cls, output_folder: str, job_id: str = None):
+        # voice_catalog imports BACKEND_DIR from this module
+        from voice_catalog import VOICE_IDS
+
+        job_id = job_id or uuid.uuid4().hex
+        workspace = cls(os.path.join(output_folder, 'jobs', job_id), job_id)
+        # Pick the narrator up front; otherwise every section and upgrade render would pick its own
+        workspace.voice_id = random.choice(VOICE_IDS)
+        return workspace
+
+    def section(self, index: int):
+        """A nested workspace for rendering one section of the scene on its own"""
+        section = Workspace(os.path.join(self.root, 'sections', f'{index:03d}'), self.job_id)
+        section.voice_id = self.voice_id
+        return section
+
+    def video_dir(self, quality: str, module: str = 'generated_manim_code') -> str:
+        return os.path.join(self.media_dir, 'videos', module, quality)
+
+    def render_env(self) -> dict:
+        """Environment for manim subprocesses rendering code in this workspace"""
+        env = os.environ.copy()
+        python_path = env.get('PYTHONPATH')
+        env['PYTHONPATH'] = BACKEND_DIR + (os.pathsep + python_path if python_path else '')
+        if self.voice_id is not None:
+            env['CLARITY_VOICE_ID'] = self.voice_id
+        return env
+
+    def remove(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def prune_workspaces(output_folder: str, max_age: float):
+    """Delete job workspaces that have not been touched for max_age seconds"""
+    jobs_dir = os.path.join(output_folder, 'jobs')
+    if not os.path.isdir(jobs_dir):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(jobs_dir):
+        path = os.path.join(jobs_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                logger.info(f"Pruning stale workspace: {path}")
+                shutil.rmtree(path, ignore_errors=True)
+        except FileNotFoundError:
+            continue
@@ -4,12 +4,42 @@ import React, { useState, useRef, useEffect } from "react";
 import Image from "next/image";
 import Input from "@/components/ui/input";
 
+const API_URL = 'http://localhost:8000';
+const POLL_INTERVAL_MS = 2000;
+const HLS_MIME_TYPE = 'application/vnd.apple.mpegurl';
+
+const isStreamUrl = (url: string) => url.endsWith('.m3u8');
+
 export function MainContent() {
   const [showInput, setShowInput] = useState(false);
   const [isProcessing, setIsProcessing] = useState(false);
   const [videoUrl, setVideoUrl] = useState("");
   const [showFullscreen, setShowFullscreen] = useState(false);
   const inputRef = useRef<HTMLTextAreaElement>(null);
+  const videoRef = useRef<HTMLVideoElement>(null);
+
+  // Play HLS streams natively (Safari) or through hls.js (Chrome, Firefox),
+  // and everything else straight from its URL
+  useEffect(() => {
+    const video = videoRef.current;
+    if (!video || !videoUrl) return;
+    if (!isStreamUrl(videoUrl) || video.canPlayType(HLS_MIME_TYPE) !== '') {
+      video.src = videoUrl;
+      return;
+    }
+    let cancelled = false;
+    let hls: import('hls.js').default | null = null;
+    import('hls.js').then(({ default: Hls }) => {
+      if (cancelled) return;
+      hls = new Hls();
+      hls.loadSource(videoUrl);
+      hls.attachMedia(video);
+    });
+    return () => {
+      cancelled = true;
+      hls?.destroy();
+    };
+  }, [videoUrl]);
 
   useEffect(() => {
     const handleKeyPress = (event: KeyboardEvent) => {
@@ -30,7 +60,7 @@ export function MainContent() {
       const formData = new FormData();
       formData.append('question', value);
 
-      const response = await fetch('http://localhost:8000/video', {
+      const response = await fetch(`${API_URL}/jobs`, {
         method: 'POST',
         body: formData,
       });
@@ -39,9 +69,42 @@ export function MainContent() {
         throw new Error('Video generation failed');
       }
 
-      const blob = await response.blob();
-      const url = URL.createObjectURL(blob);
-      setVideoUrl(url);
+      // Poll the job; start playing its HLS stream as soon as the first
+      // section is published if the browser can play HLS at all, natively or
+      // through hls.js, otherwise wait for the finished MP4. A retry streams
+      // under a new URL, and a stream that did not reach the end is dropped
+      // when the job succeeds.
+      const job = await response.json();
+      const { default: Hls } = await import('hls.js');
+      const canPlayHls = Hls.isSupported() ||
+        document.createElement('video').canPlayType(HLS_MIME_TYPE) !== '';
+      let streamUrl: string | null = null;
+      while (true) {
+        await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+        const statusResponse = await fetch(`${API_URL}/jobs/${job.job_id}`);
+        if (!statusResponse.ok) {
+          throw new Error(`Job status request failed (${statusResponse.status})`);
+        }
+        const status = await statusResponse.json();
+
+        if (status.state === 'failed') {
+          throw new Error(status.error || 'Video generation failed');
+        }
+        if (status.state === 'succeeded') {
+          if (!streamUrl || status.stream_url !== streamUrl) {
+            setVideoUrl(`${API_URL}${status.result_url}`);
+          }
+          break;
+        }
+        if (status.state !== 'queued' && status.state !== 'running') {
+          throw new Error(`Unexpected job state: ${status.state}`);
+        }
+        if (canPlayHls && status.stream_url && status.stream_url !== streamUrl) {
+          streamUrl = status.stream_url;
+          setVideoUrl(`${API_URL}${status.stream_url}`);
+          setIsProcessing(false);
+        }
+      }
     } catch (error) {
       console.error("Error generating video:", error);
       // You might want to add error handling UI here
@@ -109,7 +172,7 @@ export function MainContent() {
                       }`}
                     >
                       <video
-                        src={videoUrl}
+                        ref={videoRef}
                         className="w-full h-full object-cover"
                         controls
                       />